@@ -25,10 +25,12 @@ arguments = argparse.ArgumentParser(description='Generates MCF/Omega30 headers f
 
 arguments.add_argument('-i',
                        '--input-file',
-                       required=True)
+                       required=False,
+                       help='GCode file to process, - reads from standard input')
 arguments.add_argument('-d',
                        '--output-file',
-                       required=False)
+                       required=False,
+                       help='Output file (default overwrites the input file), - writes to standard output')
 arguments.add_argument('-o',
                        '--splice-offset',
                        type=float,
@@ -69,13 +71,123 @@ arguments.add_argument('-w',
                        help='Wait for the user to press enter after processing the file. -w [0|1]'
                        )
 
+arguments.add_argument('--daemon',
+                       action='store_true',
+                       required=False,
+                       help='Run as a background service that processes the files submitted by p2pp_client.py'
+                       )
+
+arguments.add_argument('--socket',
+                       required=False,
+                       help='UNIX socket used by the background service (default in the temporary directory)'
+                       )
+
+arguments.add_argument('--watch',
+                       required=False,
+                       metavar='DIR',
+                       help='Process every G-code file that is written into DIR'
+                       )
+
+arguments.add_argument('--watch-output',
+                       required=False,
+                       metavar='DIR',
+                       help='Output directory for --watch (default DIR/processed)'
+                       )
+
+arguments.add_argument('--jobs',
+                       type=int,
+                       required=False,
+                       default=2,
+                       help='Number of files processed at the same time in --watch mode'
+                       )
+
+arguments.add_argument('--preflight',
+                       action='store_true',
+                       required=False,
+                       help='Only scan the input file and write an estimate of the processing job as JSON to'
+                            ' standard output, exits with 1 if the file can not be processed'
+                       )
+
+arguments.add_argument('--analyze',
+                       action='store_true',
+                       required=False,
+                       help='Process the input file without writing any output, the splice information and'
+                            ' statistics are written as JSON to standard output'
+                       )
+
+arguments.add_argument('--compact',
+                       type=int,
+                       nargs='?',
+                       const=1,
+                       default=0,
+                       metavar='LEVEL',
+                       help='Leave out what the printer does not need: 1 (default) removed commands, markers, empty'
+                            ' lines and trailing zeros, 2 also all comments except ;LAYER and ping markers'
+                       )
+
+arguments.add_argument('--parameters',
+                       action='store_true',
+                       required=False,
+                       help='List the ;P2PP parameters with their type and default value'
+                       )
+
 
 def main(args):
+    if args['parameters']:
+        import p2pp.parameters as parameters
+        for parameter in parameters.parameter_list():
+            print("{:32} {:6} {}".format(parameter.name,
+                                         parameters.KIND_NAMES.get(parameter.kind, ""),
+                                         "" if parameter.target is None else repr(parameter.default)))
+        return
+
+    if args['watch']:
+        import p2pp.watch as watch
+        v.gui = False
+        v.headless = True
+        watch.watch(args['watch'], args['watch_output'], max(1, args['jobs']))
+        return
+
+    if args['daemon']:
+        # the service relies on UNIX sockets and fork, only import it when asked for
+        import p2pp.daemon as daemon
+        v.gui = False
+        v.headless = True
+        daemon.serve(args['socket'])
+        return
+
+    if not args['input_file']:
+        arguments.error("argument -i/--input-file is required")
+
+    v.compact_output = args['compact']
+
+    if args['preflight']:
+        import p2pp.preflight as preflight
+        v.gui = False
+        v.headless = True
+        sys.exit(preflight.preflight(args['input_file']))
+
+    if args['analyze']:
+        import p2pp.analyze as analyze
+        v.gui = False
+        v.headless = True
+        sys.exit(analyze.analyze(args['input_file'], args['printer_profile'], args['splice_offset']))
+
     if not args['nogui']:
         v.gui = True
     else:
         v.gui = False
 
+    # reading from stdin or writing to stdout is meant for pipelines, there is no window in that case
+    if args['input_file'] == mcf.STDIO or args['output_file'] == mcf.STDIO:
+        v.gui = False
+        v.headless = True
+    else:
+        gui.create_window()
+
+    gui.create_logitem("Python Version Information: " + platform.python_version(),
+                       "blue")
+
     v.filename = args['input_file']
 
     if args["versioncheck"] == "1":
@@ -98,10 +210,11 @@ if __name__ == "__main__":
 
     if len(sys.argv) == 1 or (len(sys.argv) == 2 and sys.argv[1] == "-i"):
         platformD = platform.system()
+        gui.create_window()
 
 
-        MASTER_VERSION = checkversion.get_version(checkversion.MASTER)
-        DEV_VERSION = checkversion.get_version(checkversion.DEV)
+        # cached versions, a stale cache is refreshed in the background for at most TIMEOUT seconds
+        MASTER_VERSION, DEV_VERSION = checkversion.get_versions(checkversion.TIMEOUT)
 
         if MASTER_VERSION and DEV_VERSION:
 
@@ -140,6 +253,4 @@ if __name__ == "__main__":
         gui.create_logitem("More info on: https://github.com/tomvandeneede/p2pp", "blue")
         gui.close_button_enable()
     else:
-        gui.create_logitem("Python Version Information: "+platform.python_version() ,
-                           "blue")
         main(vars(arguments.parse_args()))
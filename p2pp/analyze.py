@@ -0,0 +1,85 @@
+__author__ = 'Tom Van den Eede'
+__copyright__ = 'Copyright 2018-2020, Palette2 Splicer Post Processing Project'
+__credits__ = ['Tom Van den Eede',
+               'Tim Brookman'
+               ]
+__license__ = 'GPLv3'
+__maintainer__ = 'Tom Van den Eede'
+__email__ = 'P2PP@pandora.be'
+
+# Analysis only run.  The file goes through the complete processing, but the processed GCode is never rendered or
+# written.  The splice table, pings, filament usage and warnings are reported as JSON.
+
+import json
+import sys
+
+import p2pp.gui as gui
+import p2pp.mcf as mcf
+import p2pp.variables as v
+
+
+def statistics():
+    splices = []
+    for i in range(len(v.splice_extruder_position)):
+        splices.append({"input": v.splice_used_tool[i] + 1,
+                        "position": v.splice_extruder_position[i],
+                        "length": v.splice_length[i]})
+
+    pings = []
+    for i in range(len(v.ping_extruder_position)):
+        ping = {"position": v.ping_extruder_position[i]}
+        if i < len(v.ping_extrusion_between_pause):
+            ping["extrusion_between_pause"] = v.ping_extrusion_between_pause[i]
+        pings.append(ping)
+
+    inputs = []
+    for i in range(4):
+        inputs.append({"input": i + 1,
+                       "used": bool(v.palette_inputs_used[i]),
+                       "type": v.filament_type[i],
+                       "colour": v.filament_color_code[i],
+                       "extruded": v.material_extruded_per_color[i]})
+
+    transitions = []
+    for i in range(4):
+        for j in range(4):
+            if v.transition_count[i][j] > 0:
+                transitions.append({"from": i + 1,
+                                    "to": j + 1,
+                                    "count": v.transition_count[i][j],
+                                    "length": v.transition_length[i][j],
+                                    "shortest": v.transition_min_length[i][j]})
+
+    return {"splices": splices,
+            "pings": pings,
+            "ping_dwell_time": v.acc_ping_dwell_time,
+            "inputs": inputs,
+            "transitions": transitions,
+            "algorithms": v.splice_algorithm_table,
+            "total_extruded": v.total_material_extruded,
+            "hotswaps": v.hotswap_count,
+            "processing_time": v.processtime}
+
+
+def analyze(input_file, printer_profile="", splice_offset=40.0):
+    # writes the analysis as JSON to stdout, returns the exit code
+    v.analyze = True
+    mcf.generate(input_file, None, printer_profile, splice_offset, True)
+
+    if v.omega_result is None:
+        result = {"input_file": input_file, "status": "error"}
+    else:
+        if v.splice_offset == 0:
+            gui.log_warning("SPLICE_OFFSET not defined")
+        result = statistics()
+        result["input_file"] = input_file
+        result["status"] = "ok"
+        result["header"] = [line.rstrip("\n") for line in v.omega_result['header']]
+        result["summary"] = [line.rstrip("\n") for line in v.omega_result['summary']]
+    result["warnings"] = [warning[1:] for warning in v.process_warnings]
+
+    json.dump(result, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write("\n")
+    if result["status"] != "ok":
+        return 1
+    return 0
@@ -0,0 +1,97 @@
+__author__ = 'Tom Van den Eede'
+__copyright__ = 'Copyright 2018-2020, Palette2 Splicer Post Processing Project'
+__credits__ = ['Tom Van den Eede',
+               'Tim Brookman'
+               ]
+__license__ = 'GPLv3'
+__maintainer__ = 'Tom Van den Eede'
+__email__ = 'P2PP@pandora.be'
+
+# Output files are written to a temporary file in the same directory, which replaces the destination when the file
+# is closed.  The input file can be overwritten safely and jobs writing to the same directory don't interfere.
+
+import os
+import tempfile
+
+import p2pp.variables as v
+
+
+def _umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+def replace(source, destination):
+    try:
+        # python 3.x
+        os.replace(source, destination)
+    except AttributeError:
+        if os.name == "nt" and os.path.exists(destination):
+            os.remove(destination)
+        os.rename(source, destination)
+
+
+class AtomicFile:
+    # binary file object, the data only appears under filename once the file is closed
+
+    def __init__(self, filename):
+        self.filename = filename
+        directory = os.path.dirname(os.path.abspath(filename))
+        fd, self.tmpname = tempfile.mkstemp(prefix=".{}.".format(os.path.basename(filename)), suffix=".tmp",
+                                            dir=directory)
+        self.file = os.fdopen(fd, "wb")
+
+    def write(self, data):
+        self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    @property
+    def closed(self):
+        return self.file.closed
+
+    def close(self):
+        if self.file.closed:
+            return
+
+        try:
+            self.file.flush()
+            if v.sync_output:
+                os.fsync(self.file.fileno())
+            self.file.close()
+
+            # mkstemp creates the file readable for the owner only, use the permissions of the file that is replaced
+            try:
+                mode = os.stat(self.filename).st_mode & 0o7777
+            except OSError:
+                mode = 0o666 & ~_umask()
+            os.chmod(self.tmpname, mode)
+
+            replace(self.tmpname, self.filename)
+        except Exception:
+            # a failed close leaves no temporary file behind
+            self.discard()
+            raise
+
+    def discard(self):
+        if not self.file.closed:
+            try:
+                self.file.close()
+            except Exception:
+                pass
+        try:
+            os.remove(self.tmpname)
+        except OSError:
+            # already replaced the destination
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
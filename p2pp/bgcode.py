@@ -0,0 +1,397 @@
+__author__ = 'Tom Van den Eede'
+__copyright__ = 'Copyright 2018-2020, Palette2 Splicer Post Processing Project'
+__credits__ = ['Tom Van den Eede',
+               'Tim Brookman'
+               ]
+__license__ = 'GPLv3'
+__maintainer__ = 'Tom Van den Eede'
+__email__ = 'P2PP@pandora.be'
+
+# Binary GCode (.bgcode) as written by PrusaSlicer 2.7 and later.
+#
+# A file header (GCDE, version, checksum type) is followed by blocks: file metadata, printer metadata, thumbnails,
+# print metadata, slicer metadata and the gcode blocks.  Every block has a header (type, compression, sizes),
+# block parameters (encoding, or the image format for thumbnails), the data and an optional CRC32 checksum.
+# Metadata blocks hold key=value lines, gcode blocks hold plain or MeatPack encoded GCode.
+#
+# The reader supports all compression types (deflate, heatshrink 11/4 and 12/4) and encodings, the writer
+# deflates the gcode blocks and leaves the GCode unencoded.
+
+import re
+import struct
+import zlib
+
+import p2pp.atomicfile as atomicfile
+
+MAGIC = b"GCDE"
+VERSION = 1
+
+CHECKSUM_NONE = 0
+CHECKSUM_CRC32 = 1
+
+BLOCK_FILE_METADATA = 0
+BLOCK_GCODE = 1
+BLOCK_SLICER_METADATA = 2
+BLOCK_PRINTER_METADATA = 3
+BLOCK_PRINT_METADATA = 4
+BLOCK_THUMBNAIL = 5
+
+COMPRESSION_NONE = 0
+COMPRESSION_DEFLATE = 1
+COMPRESSION_HEATSHRINK_11_4 = 2
+COMPRESSION_HEATSHRINK_12_4 = 3
+
+ENCODING_NONE = 0
+ENCODING_MEATPACK = 1
+ENCODING_MEATPACK_COMMENTS = 2
+
+METADATA_BLOCKS = {BLOCK_FILE_METADATA: "file_metadata",
+                   BLOCK_PRINTER_METADATA: "printer_metadata",
+                   BLOCK_PRINT_METADATA: "print_metadata",
+                   BLOCK_SLICER_METADATA: "slicer_metadata"}
+
+# PrusaSlicer limits the uncompressed size of a gcode block to 64K
+GCODE_BLOCK_SIZE = 65536
+
+# MeatPack packs two characters per byte, 0b1111 signals a full width character in the next byte
+MEATPACK_SIGNAL = 0xFF
+MEATPACK_ENABLE_PACKING = 251
+MEATPACK_DISABLE_PACKING = 250
+MEATPACK_RESET_ALL = 249
+MEATPACK_ENABLE_NO_SPACES = 247
+MEATPACK_DISABLE_NO_SPACES = 246
+MEATPACK_CHARACTERS = bytearray(b"0123456789. \nGX")
+MEATPACK_CHARACTERS_NO_SPACES = bytearray(b"0123456789.E\nGX")
+MEATPACK_SPACES = re.compile(br"(?<=[^ ])([A-Z])")
+
+
+def is_bgcode(data):
+    return data[:4] == MAGIC
+
+
+def _text(data):
+    if isinstance(data, str):
+        # python 2.x
+        return data
+    return data.decode('utf-8')
+
+
+def _parse_metadata(data):
+    metadata = []
+    for line in _text(data).splitlines():
+        key, sep, value = line.partition("=")
+        if sep:
+            metadata.append((key.strip(), value.strip()))
+    return metadata
+
+
+def _format_metadata(metadata):
+    return "".join("{}={}\n".format(key, value) for key, value in metadata).encode('utf-8')
+
+
+def heatshrink_decode(data, window, lookahead, size):
+    # LZSS bit stream, msb first: a 1 bit is followed by a literal byte, a 0 bit by a back reference
+    # of window bits (offset - 1) and lookahead bits (count - 1)
+    data = bytearray(data) + bytearray(3)
+    total_bits = (len(data) - 3) * 8
+    out = bytearray()
+    bitpos = 0
+
+    def bits(pos, count):
+        idx = pos >> 3
+        chunk = (data[idx] << 16) | (data[idx + 1] << 8) | data[idx + 2]
+        return (chunk >> (24 - (pos & 7) - count)) & ((1 << count) - 1)
+
+    while len(out) < size:
+        if bitpos + 9 > total_bits:
+            break
+        if bits(bitpos, 1):
+            out.append(bits(bitpos + 1, 8))
+            bitpos += 9
+        else:
+            if bitpos + 1 + window + lookahead > total_bits:
+                break
+            offset = bits(bitpos + 1, window) + 1
+            count = bits(bitpos + 1 + window, lookahead) + 1
+            bitpos += 1 + window + lookahead
+            start = len(out) - offset
+            if start < 0:
+                # references before the start of the data point into the zero initialized window
+                for i in range(count):
+                    out.append(out[start + i] if start + i >= 0 else 0)
+            elif count <= offset:
+                out += out[start:start + count]
+            else:
+                for i in range(count):
+                    out.append(out[start + i])
+
+    return bytes(out[:size])
+
+
+def meatpack_decode(data):
+    out = bytearray()
+    packing = False
+    spaces_dropped = False
+    signal = False
+    command = False
+    full_chars = 0
+    char_buf = None
+
+    characters = MEATPACK_CHARACTERS
+    for c in bytearray(data):
+        if c == MEATPACK_SIGNAL:
+            if signal:
+                command = True
+                signal = False
+            else:
+                signal = True
+            continue
+
+        if command:
+            command = False
+            if c == MEATPACK_ENABLE_PACKING:
+                packing = True
+            elif c == MEATPACK_DISABLE_PACKING or c == MEATPACK_RESET_ALL:
+                packing = False
+            elif c == MEATPACK_ENABLE_NO_SPACES:
+                spaces_dropped = True
+                characters = MEATPACK_CHARACTERS_NO_SPACES
+            elif c == MEATPACK_DISABLE_NO_SPACES:
+                characters = MEATPACK_CHARACTERS
+            continue
+
+        received = [c]
+        if signal:
+            # a single signal byte is regular data
+            received.insert(0, MEATPACK_SIGNAL)
+            signal = False
+
+        for c in received:
+            if not packing:
+                out.append(c)
+            elif full_chars > 0:
+                out.append(c)
+                if char_buf is not None:
+                    out.append(char_buf)
+                    char_buf = None
+                full_chars -= 1
+            else:
+                low = c & 0x0F
+                high = c >> 4
+                if low == 0x0F:
+                    full_chars += 1
+                    if high == 0x0F:
+                        full_chars += 1
+                    else:
+                        char_buf = characters[high]
+                else:
+                    out.append(characters[low])
+                    # a packed newline is padded with an unused nibble
+                    if low != 0x0C:
+                        if high == 0x0F:
+                            full_chars += 1
+                        else:
+                            out.append(characters[high])
+
+    if not spaces_dropped:
+        return bytes(out)
+
+    # the encoder drops the spaces between the parameters of G lines, put them back
+    lines = bytes(out).split(b"\n")
+    for idx in range(len(lines)):
+        line = lines[idx]
+        if line.startswith(b"G"):
+            code, sep, comment = line.partition(b";")
+            lines[idx] = MEATPACK_SPACES.sub(b" \\1", code) + sep + comment
+    return b"\n".join(lines)
+
+
+def _decompress(compression, data, size):
+    if compression == COMPRESSION_NONE:
+        return data
+    if compression == COMPRESSION_DEFLATE:
+        return zlib.decompress(data)
+    if compression == COMPRESSION_HEATSHRINK_11_4:
+        return heatshrink_decode(data, 11, 4, size)
+    if compression == COMPRESSION_HEATSHRINK_12_4:
+        return heatshrink_decode(data, 12, 4, size)
+    raise IOError("bgcode: unsupported compression type {}".format(compression))
+
+
+def read(data):
+    # returns a dictionary with the metadata as lists of (key, value) tuples, the thumbnail blocks as
+    # they are stored in the file and the decoded GCode (bytes)
+    if not is_bgcode(data) or len(data) < 10:
+        raise IOError("bgcode: not a binary GCode file")
+
+    version, checksum_type = struct.unpack_from("<IH", data, 4)
+    if checksum_type not in (CHECKSUM_NONE, CHECKSUM_CRC32):
+        raise IOError("bgcode: unsupported checksum type {}".format(checksum_type))
+    checksum_size = 4 if checksum_type == CHECKSUM_CRC32 else 0
+
+    result = {"version": version,
+              "file_metadata": [],
+              "printer_metadata": [],
+              "print_metadata": [],
+              "slicer_metadata": [],
+              "thumbnails": []}
+    gcode = []
+
+    pos = 10
+    while pos < len(data):
+        if pos + 8 > len(data):
+            raise IOError("bgcode: truncated block header at offset {}".format(pos))
+        block_type, compression, size = struct.unpack_from("<HHI", data, pos)
+        header_size = 8
+        compressed_size = size
+        if compression != COMPRESSION_NONE:
+            compressed_size = struct.unpack_from("<I", data, pos + 8)[0]
+            header_size = 12
+        parameter_size = 6 if block_type == BLOCK_THUMBNAIL else 2
+
+        start = pos + header_size + parameter_size
+        end = start + compressed_size
+        if end + checksum_size > len(data):
+            raise IOError("bgcode: truncated block at offset {}".format(pos))
+
+        if checksum_size:
+            checksum = struct.unpack_from("<I", data, end)[0]
+            if zlib.crc32(data[pos:end]) & 0xffffffff != checksum:
+                raise IOError("bgcode: checksum error in block at offset {}".format(pos))
+
+        if block_type == BLOCK_THUMBNAIL:
+            result["thumbnails"].append(data[pos:end])
+        else:
+            encoding = struct.unpack_from("<H", data, pos + header_size)[0]
+            block = _decompress(compression, data[start:end], size)
+            if block_type == BLOCK_GCODE:
+                if encoding in (ENCODING_MEATPACK, ENCODING_MEATPACK_COMMENTS):
+                    block = meatpack_decode(block)
+                gcode.append(block)
+            elif block_type in METADATA_BLOCKS:
+                result[METADATA_BLOCKS[block_type]] = _parse_metadata(block)
+
+        pos = end + checksum_size
+
+    result["gcode"] = b"".join(gcode)
+    return result
+
+
+def from_ascii(lines):
+    # metadata for a binary file written from ASCII GCode, the slicer metadata is taken from the configuration
+    # block PrusaSlicer appends to the file
+    result = {"version": VERSION,
+              "file_metadata": [],
+              "printer_metadata": [],
+              "print_metadata": [],
+              "slicer_metadata": [],
+              "thumbnails": []}
+
+    for line in lines[:10]:
+        if line.startswith("; generated by "):
+            result["file_metadata"] = [("Producer", line[15:].strip())]
+
+    # PrusaSlicer 2.4 and later mark the configuration block, older versions end the file with it
+    try:
+        start = lines.index("; prusaslicer_config = begin") + 1
+    except ValueError:
+        start = len(lines)
+        while start > 0 and (lines[start - 1] == "" or (lines[start - 1].startswith("; ") and "=" in lines[start - 1])):
+            start -= 1
+
+    for line in lines[start:]:
+        if line == "; prusaslicer_config = end":
+            break
+        if line.startswith("; "):
+            key, sep, value = line[2:].partition("=")
+            if sep:
+                result["slicer_metadata"].append((key.strip(), value.strip()))
+    return result
+
+
+def config_lines(bgcode):
+    # the slicer metadata in the format of the ASCII configuration comments, as used by parse_slic3r_config
+    lines = []
+    for key, value in bgcode["file_metadata"]:
+        if key == "Producer":
+            lines.append("; generated by {}".format(value))
+    for key, value in bgcode["slicer_metadata"]:
+        lines.append("; {} = {}".format(key, value))
+    return lines
+
+
+def config_block(bgcode):
+    # the configuration block PrusaSlicer appends to ASCII GCode
+    lines = ["; prusaslicer_config = begin\n"]
+    for key, value in bgcode["slicer_metadata"]:
+        lines.append("; {} = {}\n".format(key, value))
+    lines.append("; prusaslicer_config = end\n")
+    return lines
+
+
+def _block(block_type, data, encoding=ENCODING_NONE, compression=COMPRESSION_NONE):
+    if compression == COMPRESSION_DEFLATE:
+        payload = zlib.compress(data)
+        header = struct.pack("<HHII", block_type, compression, len(data), len(payload))
+    else:
+        payload = data
+        header = struct.pack("<HHI", block_type, compression, len(data))
+    return header + struct.pack("<H", encoding) + payload
+
+
+def _write_block(opf, block):
+    opf.write(block)
+    opf.write(struct.pack("<I", zlib.crc32(block) & 0xffffffff))
+
+
+def write(opf, bgcode, gcode):
+    # writes a binary GCode file to the binary stream opf, gcode is the processed GCode (bytes)
+    opf.write(MAGIC + struct.pack("<IH", VERSION, CHECKSUM_CRC32))
+
+    if bgcode["file_metadata"]:
+        _write_block(opf, _block(BLOCK_FILE_METADATA, _format_metadata(bgcode["file_metadata"])))
+    _write_block(opf, _block(BLOCK_PRINTER_METADATA, _format_metadata(bgcode["printer_metadata"])))
+    for thumbnail in bgcode["thumbnails"]:
+        _write_block(opf, thumbnail)
+    _write_block(opf, _block(BLOCK_PRINT_METADATA, _format_metadata(bgcode["print_metadata"])))
+    _write_block(opf, _block(BLOCK_SLICER_METADATA, _format_metadata(bgcode["slicer_metadata"])))
+
+    pos = 0
+    while pos < len(gcode):
+        end = pos + GCODE_BLOCK_SIZE
+        if end < len(gcode):
+            # blocks end on a line boundary
+            newline = gcode.rfind(b"\n", pos, end)
+            if newline != -1:
+                end = newline + 1
+        _write_block(opf, _block(BLOCK_GCODE, gcode[pos:end], compression=COMPRESSION_DEFLATE))
+        pos = end
+
+
+class BGCodeWriter:
+    # text stream that collects the processed GCode and writes it as binary GCode when closed
+
+    def __init__(self, filename, bgcode):
+        self.filename = filename
+        self.bgcode = bgcode
+        self.lines = []
+
+    def write(self, text):
+        self.lines.append(text)
+
+    def writelines(self, lines):
+        self.lines.extend(lines)
+
+    def flush(self):
+        pass
+
+    def discard(self):
+        self.lines = []
+
+    def close(self):
+        gcode = "".join(self.lines)
+        if not isinstance(gcode, bytes):
+            # python 3.x
+            gcode = gcode.encode('utf-8')
+        with atomicfile.AtomicFile(self.filename) as opf:
+            write(opf, self.bgcode, gcode)
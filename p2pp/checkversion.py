@@ -8,22 +8,30 @@ __maintainer__ = 'Tom Van den Eede'
 __email__ = 'P2PP@pandora.be'
 
 
+import json
+import os
 import platform
-
+import threading
+import time
 
 version = "https://github.com/tomvandeneede/p2pp/raw/{}/version.py"
 
 MASTER = version.format('master')
 DEV = version.format('dev')
 
+# online versions are looked up at most once a day, with a short network timeout
+CACHE_FILE = os.path.join(os.path.expanduser("~"), ".p2pp_versions")
+CACHE_TTL = 24 * 3600
+TIMEOUT = 3
+
 _p = platform.python_version().strip()
 python_version = _p[0]
 
-def get_version( _url_ ):
+def get_version( _url_ , timeout=TIMEOUT):
     try:
         if python_version == "2":
-            import urllib
-            response = urllib.urlopen(_url_)
+            import urllib2
+            response = urllib2.urlopen(_url_, timeout=timeout)
             lines = "".join(response).splitlines()
 
         if python_version == "3":
@@ -31,14 +39,13 @@ def get_version( _url_ ):
             import ssl
             https_sslv3_handler = urllib.request.HTTPSHandler(context=ssl.SSLContext())
             opener = urllib.request.build_opener(https_sslv3_handler)
-            urllib.request.install_opener(opener)
-            response = opener.open(_url_).read().decode('utf-8')
+            response = opener.open(_url_, timeout=timeout).read().decode('utf-8')
             lines = "".join(response).splitlines()
 
-         # get version information
-            _maj = -1
-            _min = -1
-            _bld = -1
+        # get version information
+        _maj = -1
+        _min = -1
+        _bld = -1
 
         for line in lines:
             if line.startswith("MajorVersion"):
@@ -56,4 +63,43 @@ def get_version( _url_ ):
         return None
 
 
+def read_cache():
+    try:
+        with open(CACHE_FILE) as cache:
+            return json.load(cache)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def refresh_cache():
+    versions = {"time": time.time(),
+                "master": get_version(MASTER),
+                "dev": get_version(DEV)}
+    if versions["master"] is None or versions["dev"] is None:
+        # failed lookups are not cached, the next run tries again
+        return
+    try:
+        # write to a temporary file first, the process may end while this thread is still running
+        tmp = "{}.{}".format(CACHE_FILE, os.getpid())
+        with open(tmp, "w") as cache:
+            json.dump(versions, cache)
+        os.rename(tmp, CACHE_FILE)
+    except (IOError, OSError):
+        pass
+
+
+def get_versions(wait=0):
+    # returns the (master, dev) versions from the cache.  When the cache is missing or older than a day,
+    # it is refreshed in a background thread; wait is the number of seconds to wait for the refreshed result.
+    cache = read_cache()
+    if cache is None or time.time() - cache.get("time", 0) > CACHE_TTL:
+        refresh = threading.Thread(target=refresh_cache)
+        refresh.daemon = True
+        refresh.start()
+        if wait > 0:
+            refresh.join(wait)
+            cache = read_cache() or cache
 
+    if cache is None:
+        return None, None
+    return cache.get("master"), cache.get("dev")
@@ -0,0 +1,107 @@
+__author__ = 'Tom Van den Eede'
+__copyright__ = 'Copyright 2018-2020, Palette2 Splicer Post Processing Project'
+__credits__ = ['Tom Van den Eede',
+               'Tim Brookman'
+               ]
+__license__ = 'GPLv3'
+__maintainer__ = 'Tom Van den Eede'
+__email__ = 'P2PP@pandora.be'
+
+# Compact output.  Every byte of the processed GCode has to go over the serial line or the network to the printer,
+# the compact profiles leave out what the printer does not need:
+#
+#   level 1: commands removed by P2PP and their comments, the [R_...] markers of removed parameters, empty lines
+#            and trailing zeros of the coordinates in moves
+#   level 2: level 1 and all comments except the ;LAYER lines, the ping markers and the ;P2PP parameters
+#
+# The Omega header is written as is.
+
+import re
+
+COMPACT_NONE = 0
+COMPACT_REMOVED = 1
+COMPACT_COMMENTS = 2
+
+REMOVED_PREFIXES = ("-- P2PP -- removed", " -- P2PP removed")
+REMOVED_PARAMETER = re.compile(r"\[R_[A-Z][^\]]*\] ?")
+ESSENTIAL_COMMENTS = ("LAYER", "P2PP ")
+TRIM_COMMANDS = ("G0", "G1", "G2", "G3", "G92")
+
+
+def trim_number(token):
+    # X12.300 -> X12.3, E0.00000 -> E0
+    if "." not in token:
+        return token
+    try:
+        float(token[1:])
+    except ValueError:
+        return token
+    token = token.rstrip("0").rstrip(".")
+    if token[1:] == "-0" or len(token) == 1:
+        token = token[0] + "0"
+    return token
+
+
+def essential_comment(comment):
+    return comment.startswith(ESSENTIAL_COMMENTS) or "PING" in comment
+
+
+def compact_line(line, level):
+    # the compacted line, None if the line can be left out
+    pos = line.find(";")
+    if pos == -1:
+        code = line.strip()
+        comment = ""
+    else:
+        code = line[:pos].strip()
+        comment = line[pos + 1:].rstrip()
+
+    if comment:
+        if not code and comment.startswith(REMOVED_PREFIXES):
+            return None
+        comment = REMOVED_PARAMETER.sub("", comment)
+        if level >= COMPACT_COMMENTS and not essential_comment(comment):
+            comment = ""
+
+    if code:
+        fields = code.split()
+        if fields[0] in TRIM_COMMANDS:
+            code = " ".join([fields[0]] + [trim_number(field) for field in fields[1:]])
+        if comment:
+            return code + " ;" + comment
+        return code
+
+    if comment.strip():
+        return ";" + comment
+    return None
+
+
+class CompactStream:
+    # text stream that writes the compacted lines to stream and counts the size before and after
+
+    def __init__(self, stream, level):
+        self.stream = stream
+        self.level = level
+        self.size_in = 0
+        self.size_out = 0
+
+    def write(self, text):
+        self.size_in += len(text)
+        lines = []
+        for line in text.split("\n"):
+            line = compact_line(line, self.level)
+            if line is not None:
+                lines.append(line + "\n")
+        text = "".join(lines)
+        self.size_out += len(text)
+        self.stream.write(text)
+
+    def writelines(self, lines):
+        for idx in range(0, len(lines), 1000):
+            self.write("".join(lines[idx:idx + 1000]))
+
+    def reduction(self):
+        # size reduction in percent
+        if self.size_in == 0:
+            return 0.0
+        return 100.0 * (self.size_in - self.size_out) / self.size_in
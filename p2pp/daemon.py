@@ -0,0 +1,150 @@
+__author__ = 'Tom Van den Eede'
+__copyright__ = 'Copyright 2018-2020, Palette2 Splicer Post Processing Project'
+__credits__ = ['Tom Van den Eede',
+               'Tim Brookman'
+               ]
+__license__ = 'GPLv3'
+__maintainer__ = 'Tom Van den Eede'
+__email__ = 'P2PP@pandora.be'
+
+# Persistent P2PP service.  The service imports P2PP once and forks a fresh process for every job it receives
+# on a local UNIX socket, so the slicer hook only pays for a small client instead of a full P2PP startup.
+#
+# The protocol is line based JSON: the client sends one request line, the service answers with
+# {"log": "..."} lines while the job runs, followed by a single {"result": {...}} line.
+
+import json
+import os
+import socket
+import sys
+import tempfile
+
+try:
+    import socketserver
+except ImportError:
+    # python 2.x
+    import SocketServer as socketserver
+
+
+def default_socket():
+    return os.path.join(tempfile.gettempdir(), "p2pp-{}.sock".format(os.getuid()))
+
+
+class SocketLog:
+    # file like object that forwards the console log of a job to the client
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        text = text.rstrip("\n")
+        if text:
+            self.stream.write((json.dumps({"log": text}) + "\n").encode('utf-8'))
+
+    def flush(self):
+        self.stream.flush()
+
+
+def run_job(request):
+    # runs a single job in the current process, which must not have processed a file before
+    import p2pp.mcf as mcf
+    import p2pp.parameters as parameters
+    import p2pp.variables as v
+
+    v.gui = False
+    v.headless = True
+
+    result = {"input_file": request["input_file"], "status": "ok"}
+    try:
+        mcf.generate(request["input_file"],
+                     request.get("output_file"),
+                     request.get("printer_profile", ""),
+                     float(request.get("splice_offset", 40.0)),
+                     True)
+        if len(v.input_gcode) == 0:
+            result["status"] = "error"
+    except SystemExit:
+        result["status"] = "skipped"
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = "{}: {}".format(type(e).__name__, e)
+
+    result["warnings"] = [warning[1:] for warning in v.process_warnings]
+    result["splices"] = len(v.splice_extruder_position)
+    result["pings"] = len(v.ping_extruder_position)
+    result["parameters"] = parameters.effective_values()
+    result["fingerprint"] = parameters.config_fingerprint()
+    return result
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        import p2pp.gui as gui
+
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+        except ValueError:
+            return
+
+        gui.log_stream = SocketLog(self.wfile)
+        result = run_job(request)
+        self.wfile.write((json.dumps({"result": result}) + "\n").encode('utf-8'))
+        self.wfile.flush()
+
+
+class ForkingUnixServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    pass
+
+
+def serve(socket_path=None):
+    import p2pp.gui as gui
+    # pay for all imports once, every job runs in a forked copy of this process
+    import p2pp.mcf
+
+    if not socket_path:
+        socket_path = default_socket()
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    server = ForkingUnixServer(socket_path, JobHandler)
+    os.chmod(socket_path, 0o600)
+    gui.console_log("P2PP service listening on {}".format(socket_path))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+
+
+def submit(request, socket_path=None, log_stream=sys.stdout):
+    # sends a job to the service and relays its log, returns the job result or None if no service is running
+    if not socket_path:
+        socket_path = default_socket()
+
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_path)
+    except socket.error:
+        connection.close()
+        return None
+
+    stream = connection.makefile('rwb')
+    stream.write((json.dumps(request) + "\n").encode('utf-8'))
+    stream.flush()
+
+    result = {"input_file": request["input_file"], "status": "error", "error": "connection to P2PP service lost"}
+    for line in stream:
+        message = json.loads(line.decode('utf-8'))
+        if "log" in message:
+            log_stream.write(message["log"] + "\n")
+            log_stream.flush()
+        if "result" in message:
+            result = message["result"]
+
+    stream.close()
+    connection.close()
+    return result
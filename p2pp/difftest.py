@@ -0,0 +1,454 @@
+__author__ = 'Tom Van den Eede'
+__copyright__ = 'Copyright 2018-2020, Palette2 Splicer Post Processing Project'
+__credits__ = ['Tom Van den Eede',
+               'Tim Brookman'
+               ]
+__license__ = 'GPLv3'
+__maintainer__ = 'Tom Van den Eede'
+__email__ = 'P2PP@pandora.be'
+
+# Differential test.  Processes a corpus of files with a legacy P2PP tree and with a candidate tree and compares the
+# results: the Omega header (splice and ping positions within tolerance, algorithms) and the processed GCode with
+# comments removed and numbers compared within tolerance.  The first divergence of every file is reported with
+# the lines leading up to it.
+#
+#   python -m p2pp.difftest --legacy <directory or git revision> [--candidate <directory>] [--synthetic N] files...
+#
+# Both trees are run in their own interpreter.  Trees from before the headless mode (the --daemon / --watch
+# support) build the Tk window when p2pp.gui is imported, they get a stub for tkinter so they run without a display.
+
+import argparse
+import io
+import os
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+# splice and ping positions (mm)
+POSITION_TOLERANCE = 0.01
+# coordinates and feed rates are written with 3 decimals, extrusions with 5
+VALUE_TOLERANCE = 0.0011
+EXTRUSION_TOLERANCE = 0.00002
+CONTEXT_LINES = 3
+
+SYNTHETIC_MODES = ["tower", "fpr", "delta", "acc", "side"]
+
+PROCESSED_MARKER = "START PROCESSED GCODE"
+
+# exit codes
+EXIT_SAME = 0
+EXIT_DIFF = 1
+EXIT_FAILED = 2
+
+RUNNER = """
+import os
+import sys
+sys.path.insert(0, sys.argv[1])
+
+
+class TkStub(object):
+    # stands in for every tkinter module, widget, variable and constant
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        if name.startswith("winfo_"):
+            # window geometry
+            return lambda *args: 0
+        return TkStub()
+
+    def __call__(self, *args, **kwargs):
+        return TkStub()
+
+    def __getitem__(self, key):
+        return TkStub()
+
+    def __setitem__(self, key, value):
+        pass
+
+    def __iter__(self):
+        return iter([])
+
+
+with open(os.path.join(sys.argv[1], "p2pp", "gui.py")) as f:
+    if "def create_window" not in f.read():
+        for name in ["tkinter", "tkinter.ttk", "tkinter.messagebox", "Tkinter", "ttk", "tkMessageBox"]:
+            sys.modules[name] = TkStub()
+
+import p2pp.variables as v
+v.gui = False
+v.headless = True
+import p2pp.mcf as mcf
+mcf.generate(sys.argv[2], sys.argv[3], "", 40.0, True)
+"""
+
+
+# -------------------------------------------------------------------------------------------------------------------
+# synthetic files, a four colour print with a wipe tower, every mode of operation uses the same model
+# -------------------------------------------------------------------------------------------------------------------
+
+def synthetic_gcode(mode, seed, layers=40):
+    rnd = random.Random(seed)
+    tx, ty = 170, 140
+    gcode = ["; generated by PrusaSlicer 2.2.0+linux on 2020-01-01",
+             ";P2PP PRINTERPROFILE=0123456789abcdef",
+             ";P2PP SPLICEOFFSET=30",
+             ";P2PP MATERIAL_DEFAULT_0_0_0"]
+    if mode == "fpr":
+        gcode.append(";P2PP FULLPURGEREDUCTION")
+    if mode == "delta":
+        gcode.append(";P2PP PURGETOWERDELTA=2")
+    if mode == "acc":
+        gcode.append(";P2PP ACCESSORYMODE_MAF")
+    if mode == "side":
+        gcode.append(";P2PP SIDEWIPELOC=X255")
+        gcode.append(";P2PP AUTOADDPURGE")
+
+    def model_lines():
+        for i in range(30):
+            gcode.append("G1 X{:.3f} Y{:.3f} E{:.5f}".format(50 + rnd.random() * 80, 50 + rnd.random() * 80,
+                                                              rnd.random() * 2))
+
+    def tower_lines(count, e):
+        for i in range(count):
+            gcode.append("G1 X{:.3f} Y{:.3f} E{:.5f} F2400".format(tx + rnd.random() * 38, ty + 1 + rnd.random() * 18,
+                                                                    e))
+
+    gcode.extend(["M107", "M104 S215", "G21", "G90", "M83", "G92 E0", "T0", "G1 X10 Y-3 E8 F1000"])
+    tool = 0
+    for layer in range(layers):
+        z = 0.2 + 0.2 * layer
+        gcode.extend([";LAYER_CHANGE", ";Z:{:.1f}".format(z), ";LAYER {}".format(layer),
+                      ";LAYERHEIGHT {:.1f}".format(z), "G1 Z{:.3f} F10800".format(z)])
+        if layer == 0:
+            gcode.append("; CP WIPE TOWER FIRST LAYER BRIM START")
+            gcode.append("G1 X{:.3f} Y{:.3f} F7200".format(tx, ty))
+            for i in range(4):
+                gcode.append("G1 X{:.3f} Y{:.3f} E{:.5f}".format(tx + 40, ty, 1.2))
+                gcode.append("G1 X{:.3f} Y{:.3f} E{:.5f}".format(tx + 40, ty + 20, 0.6))
+                gcode.append("G1 X{:.3f} Y{:.3f} E{:.5f}".format(tx, ty + 20, 1.2))
+                gcode.append("G1 X{:.3f} Y{:.3f} E{:.5f}".format(tx, ty, 0.6))
+            gcode.append("; CP WIPE TOWER FIRST LAYER BRIM END")
+
+        model_lines()
+        gcode.extend(["G1 E-0.8 F2100", "G1 X60 Y60 F9000", "G1 E0.8 F2100", "M106 S{}".format(rnd.randint(0, 255))])
+        gcode.append("G1 X{:.3f} Y{:.3f} F7200".format(tx + 2, ty + 2))
+        if layer % 3 == 1 or layer < 3:
+            tool = (tool + 1) % 4
+            gcode.extend(["; CP TOOLCHANGE START", "M220 B", "M220 S100", "; CP TOOLCHANGE UNLOAD",
+                          "G1 X{:.3f} Y{:.3f} E1.0 F2000".format(tx + 5, ty + 3), "G1 E-2 F3000", "G4 S0",
+                          "T{}".format(tool), "M900 K0", "; CP TOOLCHANGE WIPE"])
+            tower_lines(25, 2.5)
+            gcode.append("; CP TOOLCHANGE END")
+            gcode.append("G1 X{:.3f} Y{:.3f} F7200".format(tx + 20, ty + 10))
+        else:
+            gcode.append("; CP EMPTY GRID START")
+            tower_lines(6, 0.5)
+            gcode.append("; CP EMPTY GRID END")
+        gcode.append("G1 X80 Y80 F7200")
+        model_lines()
+
+    gcode.extend(["M107", "M104 S0", "M84", "; filament used [mm] = 1000"])
+    for key, value in [("wipe_tower_x", 300 if mode == "side" else tx),
+                       ("wipe_tower_y", ty),
+                       ("wipe_tower_width", 40),
+                       ("extrusion_width", "0.45"),
+                       ("layer_height", "0.2"),
+                       ("first_layer_height", "0.2"),
+                       ("filament_diameter", "1.75,1.75,1.75,1.75"),
+                       ("filament_type", "PLA;PLA;PETG;PLA"),
+                       ("extruder_colour", '"#FF0000;#00FF00;#0000FF;#FFFFFF"'),
+                       ("retract_length", "0.8,0.8,0.8,0.8"),
+                       ("retract_lift", "0.6,0.6,0.6,0.6"),
+                       ("use_relative_e_distances", "1"),
+                       ("use_firmware_retraction", "0"),
+                       ("wiping_volumes_matrix", "0,140,140,140,140,0,140,140,140,140,0,140,140,140,140,0"),
+                       ("wipe_tower_no_sparse_layers", "0"),
+                       ("support_material_synchronize_layers", "0"),
+                       ("gcode_flavor", "marlin")]:
+        gcode.append("; {} = {}".format(key, value))
+    return "\n".join(gcode) + "\n"
+
+
+def write_synthetic(directory, count):
+    files = []
+    for seed in range(count):
+        for mode in SYNTHETIC_MODES:
+            filename = os.path.join(directory, "synthetic_{}_{}.gcode".format(mode, seed))
+            with open(filename, "w") as f:
+                f.write(synthetic_gcode(mode, seed))
+            files.append(filename)
+    return files
+
+
+# -------------------------------------------------------------------------------------------------------------------
+# running the engines
+# -------------------------------------------------------------------------------------------------------------------
+
+def export_revision(revision, directory):
+    # a git revision of the tree this module lives in
+    repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    data = subprocess.check_output(["git", "archive", "--format=tar", revision], cwd=repository)
+    archive = tarfile.open(fileobj=io.BytesIO(data))
+    archive.extractall(directory)
+    archive.close()
+    return directory
+
+
+def run_engine(tree, input_file, output_file):
+    # returns the output lines (GCode and MAF) or None when processing failed, and the console output
+    env = dict(os.environ)
+    env["PYTHONHASHSEED"] = "0"
+    process = subprocess.Popen([sys.executable, "-c", RUNNER, tree, input_file, output_file],
+                               cwd=os.path.dirname(output_file), env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    console = process.communicate()[0].decode("utf-8", "replace")
+    if process.returncode != 0 or not os.path.exists(output_file):
+        return None, None, console
+
+    with io.open(output_file, "r", encoding="utf-8", errors="replace") as f:
+        gcode = f.read().splitlines()
+    maf = None
+    maf_file = os.path.splitext(output_file)[0] + ".maf"
+    if os.path.exists(maf_file):
+        with io.open(maf_file, "r", encoding="utf-8", errors="replace") as f:
+            maf = f.read().splitlines()
+    return gcode, maf, console
+
+
+# -------------------------------------------------------------------------------------------------------------------
+# normalising and comparing
+# -------------------------------------------------------------------------------------------------------------------
+
+def hex_to_float(s):
+    # inverse of formatnumbers.hexify_float
+    return struct.unpack('<f', struct.pack('<I', int(s[1:], 16)))[0]
+
+
+def strip_comment(line):
+    pos = line.find(";")
+    if pos != -1:
+        line = line[:pos]
+    return line.strip()
+
+
+def split_output(lines):
+    # (header, gcode) as lists of (line number, normalised line)
+    header = []
+    gcode = []
+    processed = False
+    for idx in range(len(lines)):
+        line = lines[idx]
+        if PROCESSED_MARKER in line:
+            processed = True
+            continue
+        stripped = strip_comment(line)
+        if stripped == "":
+            continue
+        if not processed and stripped[0] == "O" and stripped[1:2].isdigit():
+            header.append((idx, stripped))
+        elif processed:
+            gcode.append((idx, stripped))
+    return header, gcode
+
+
+def omega_equal(a, b):
+    ta = a.split()
+    tb = b.split()
+    if len(ta) != len(tb) or ta[0] != tb[0]:
+        return False
+    for i in range(1, len(ta)):
+        if ta[i] == tb[i]:
+            continue
+        if ta[0] in ("O30", "O31") and len(ta[i]) == 9 and len(tb[i]) == 9:
+            try:
+                if abs(hex_to_float(ta[i]) - hex_to_float(tb[i])) <= POSITION_TOLERANCE:
+                    continue
+            except ValueError:
+                pass
+        elif ta[0] == "O1" and ta[i][0] == "D" and tb[i][0] == "D":
+            # total length in whole mm, may round the other way
+            try:
+                if abs(int(ta[i][1:], 16) - int(tb[i][1:], 16)) <= 1:
+                    continue
+            except ValueError:
+                pass
+        return False
+    return True
+
+
+def gcode_equal(a, b):
+    ta = a.split()
+    tb = b.split()
+    if len(ta) != len(tb) or ta[0] != tb[0]:
+        return False
+    if ta[0][0] == "O":
+        return omega_equal(a, b)
+    for i in range(1, len(ta)):
+        if ta[i] == tb[i]:
+            continue
+        if ta[i][0] != tb[i][0]:
+            return False
+        try:
+            va = float(ta[i][1:])
+            vb = float(tb[i][1:])
+        except ValueError:
+            return False
+        tolerance = EXTRUSION_TOLERANCE if ta[i][0] == "E" else VALUE_TOLERANCE
+        if abs(va - vb) > tolerance:
+            return False
+    return True
+
+
+def first_divergence(a, b, equal):
+    # index of the first differing entry, None when the lists match
+    for i in range(min(len(a), len(b))):
+        if not equal(a[i][1], b[i][1]):
+            return i
+    if len(a) != len(b):
+        return min(len(a), len(b))
+    return None
+
+
+def context(lines, entries, idx):
+    if idx < len(entries):
+        last = entries[idx][0]
+    else:
+        last = len(lines) - 1
+    result = []
+    for i in range(max(0, last - CONTEXT_LINES), min(len(lines), last + 1)):
+        result.append("  {:7} {}".format(i + 1, lines[i]))
+    if idx >= len(entries):
+        result.append("          <end of output>")
+    return result
+
+
+def compare_lines(name, legacy, candidate):
+    # report lines for the first divergence in the header and in the processed GCode
+    report = []
+    legacy_header, legacy_gcode = split_output(legacy)
+    candidate_header, candidate_gcode = split_output(candidate)
+    for part, a, b, equal in [("header", legacy_header, candidate_header, omega_equal),
+                              ("gcode", legacy_gcode, candidate_gcode, gcode_equal)]:
+        idx = first_divergence(a, b, equal)
+        if idx is None:
+            continue
+        report.append("{} {} differs at entry {}".format(name, part, idx + 1))
+        report.append(" legacy:")
+        report.extend(context(legacy, a, idx))
+        report.append(" candidate:")
+        report.extend(context(candidate, b, idx))
+    return report
+
+
+def compare_file(input_file, legacy_tree, candidate_tree, work):
+    # (failed, report), failed when one of the engines did not produce an output.  The outputs are plain GCode,
+    # whatever the format of the input
+    name = os.path.basename(input_file)
+    for extension in (".gz", ".zst"):
+        if name.endswith(extension):
+            name = name[:-len(extension)]
+    if name.endswith(".bgcode"):
+        name = name[:-len(".bgcode")] + ".gcode"
+    results = []
+    for label, tree in [("legacy", legacy_tree), ("candidate", candidate_tree)]:
+        directory = os.path.join(work, label)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        results.append(run_engine(tree, input_file, os.path.join(directory, name)))
+
+    (legacy, legacy_maf, legacy_console), (candidate, candidate_maf, candidate_console) = results
+    if legacy is None or candidate is None:
+        report = []
+        if legacy is None:
+            report.append("{} legacy engine failed:".format(name))
+            report.extend("  " + line for line in legacy_console.splitlines()[-10:])
+        if candidate is None:
+            report.append("{} candidate engine failed:".format(name))
+            report.extend("  " + line for line in candidate_console.splitlines()[-10:])
+        return True, report
+
+    report = compare_lines(name, legacy, candidate)
+    if (legacy_maf is None) != (candidate_maf is None):
+        report.append("{} maf file written by one engine only".format(name))
+    elif legacy_maf is not None:
+        report.extend(compare_lines(name + " maf", legacy_maf, candidate_maf))
+    return False, report
+
+
+def collect(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith((".gcode", ".gcode.gz", ".gcode.zst", ".bgcode")):
+                    files.append(os.path.join(path, name))
+        else:
+            files.append(path)
+    return files
+
+
+def main(argv=None):
+    arguments = argparse.ArgumentParser(description='Compares the output of two P2PP trees over a set of files.')
+    arguments.add_argument('files', nargs='*', help='GCode files or directories with GCode files')
+    arguments.add_argument('--legacy', required=True,
+                           help='Reference tree, a directory or a git revision of this repository')
+    arguments.add_argument('--candidate',
+                           default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           help='Tree under test (default this tree)')
+    arguments.add_argument('--synthetic', type=int, default=0, metavar='N',
+                           help='Add N generated files for every mode of operation')
+    arguments.add_argument('--keep', action='store_true',
+                           help='Keep the working directory with the outputs')
+    args = arguments.parse_args(argv)
+
+    work = tempfile.mkdtemp(prefix="p2pp_difftest_")
+    try:
+        legacy_tree = args.legacy
+        if not os.path.isdir(legacy_tree):
+            legacy_tree = export_revision(args.legacy, os.path.join(work, "legacy_tree"))
+
+        corpus = os.path.join(work, "corpus")
+        os.makedirs(corpus)
+        files = collect(args.files) + write_synthetic(corpus, args.synthetic)
+        if not files:
+            arguments.error("no input files")
+
+        differences = 0
+        failures = 0
+        for input_file in files:
+            # both engines get their own copy, engines without an output option overwrite their input
+            copy = os.path.join(corpus, "input_" + os.path.basename(input_file))
+            shutil.copyfile(input_file, copy)
+            failed, report = compare_file(copy, os.path.abspath(legacy_tree), os.path.abspath(args.candidate), work)
+            os.remove(copy)
+            if failed:
+                failures += 1
+                print("FAILED {}".format(input_file))
+            elif report:
+                differences += 1
+                print("DIFF {}".format(input_file))
+            else:
+                print("same {}".format(input_file))
+            for line in report:
+                print(line)
+
+        print("{} files compared, {} differ, {} engine failures".format(len(files), differences, failures))
+        if args.keep:
+            print("outputs kept in {}".format(work))
+        if failures:
+            return EXIT_FAILED
+        if differences:
+            return EXIT_DIFF
+        return EXIT_SAME
+    finally:
+        if not args.keep:
+            shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
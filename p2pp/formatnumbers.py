@@ -36,6 +36,26 @@ def hexify_float(f):
     return "D{:0>8}".format(_number)
 
 
+# fixed point GCode parameters: 3 decimals for the coordinates, 5 for the extrusion.  printf style formatting gives
+# the same (correctly rounded) result as "{:0.3f}" but skips parsing the format specification on every call
+FIXED_FORMATS = {"X": "X%.3f ",
+                 "Y": "Y%.3f ",
+                 "Z": "Z%.3f ",
+                 "E": "E%.5f "}
+FIXED_FORMATS_SPEC = {"X": "{}{:0.3f} ",
+                      "Y": "{}{:0.3f} ",
+                      "Z": "{}{:0.3f} ",
+                      "E": "{}{:0.5f} "}
+
+
+def format_fixed(key, value):
+    # key is one of X, Y, Z, E, value a number as parsed from the GCode
+    if type(value) is float or type(value) is int:
+        return FIXED_FORMATS[key] % value
+    # anything else fails or formats exactly like it always did
+    return FIXED_FORMATS_SPEC[key].format(key, value)
+
+
 def hours(sec):
     return int(sec / 3600)
 
@@ -15,8 +15,18 @@ EXTRUDER = "E"
 RELATIVE = True
 ABSOLUTE = False
 
+# number of issued commands that are kept as objects so look-back edits can update them in place
+PENDING_COMMANDS = 10
+
+from collections import deque
+from string import Formatter
+
 import p2pp.gui as gui
 import p2pp.variables as v
+from p2pp.formatnumbers import format_fixed
+
+# issued commands (GCodeCommand objects or already rendered lines) not yet rendered to v.processed_gcode
+pending_commands = deque()
 
 
 class GCodeCommand:
@@ -59,18 +69,7 @@ class GCodeCommand:
             while len(fields) > 0:
                 param = fields[0].strip()
                 if len(param) > 0:
-                    p = param[0]
-                    val = param[1:]
-
-                    try:
-                        if "." in val:
-                            val = float(val)
-                        else:
-                            val = int(val)
-                    except ValueError:
-                        pass
-
-                    self.Parameters[p] = val
+                    self.Parameters[param[0]] = parse_value(param[1:])
 
                 fields = fields[1:]
 
@@ -80,44 +79,7 @@ class GCodeCommand:
             self.E = self.get_parameter("E", None)
 
     def __str__(self):
-        p = ""
-
-        # use the same formatting as prusa to ease file compares (X, Y, Z, E, F)
-
-        sorted_keys = "XYZE"
-        if self.is_movement_command():
-            for key in sorted_keys:
-                if key in self.Parameters:
-                    form = ""
-                    if key in "XYZ":
-                        form = "{}{:0.3f} "
-                    if key == "E":
-                        form = "{}{:0.5f} "
-                    value = self.Parameters[key]
-                    if value == None:
-                        gui.log_warning("GCode error detected, file might not print correctly")
-                        value = ""
-
-                    p = p + form.format(key, value)
-
-        for key in self.Parameters:
-            if not self.is_movement_command() or key not in sorted_keys:
-                value = self.Parameters[key]
-                if value == None:
-                    value = ""
-
-                p = p + "{}{} ".format(key, value)
-
-        c = self.fullcommand
-        if not c:
-            c = ""
-
-        if not self.Comment:
-            co = ""
-        else:
-            co = ";" + self.Comment
-
-        return ("{} {} {}".format(c, p, co)).strip() + "\n"
+        return render(self.fullcommand, self.Parameters, self.Comment, self.is_movement_command())
 
     def update_parameter(self, parameter, value):
         self.Parameters[parameter] = value
@@ -150,7 +112,11 @@ class GCodeCommand:
 
     def move_to_comment(self, text):
         if self.Command:
-            self.Comment = "-- P2PP -- removed [{}] - {}".format(text, self)
+            if v.analyze:
+                # the comment is never rendered, skip formatting the command
+                self.Comment = "-- P2PP -- removed [{}]".format(text)
+            else:
+                self.Comment = "-- P2PP -- removed [{}] - {}".format(text, self)
 
         self.Command = None
         self.Command_value = None
@@ -187,24 +153,23 @@ class GCodeCommand:
             return self.Parameters[parm]
         return defaultvalue
 
-    def issue_command(self):
+    def account_extrusion(self):
         if self.E is not None and self.is_movement_command():
-            v.total_material_extruded += self.E * v.extrusion_multiplier * v.extrusion_multiplier_correction
-            v.material_extruded_per_color[
-                v.current_tool] += self.E * v.extrusion_multiplier * v.extrusion_multiplier_correction
+            account_extrusion(self.E)
 
-        v.processed_gcode.append(str(self))
-        # v.processed_gcode.append(  "[{}]  {} ".format(v.classes[self.Class],str(self)))
+    def issue_command(self):
+        self.account_extrusion()
+        issue(self)
 
     def issue_command_speed(self, speed):
+        if v.analyze:
+            self.account_extrusion()
+            issue(self)
+            return
         s = str(self)
         s = s.replace("%SPEED%", "{:0.0f}".format(speed))
-        if self.E is not None and self.is_movement_command():
-            v.total_material_extruded += self.E * v.extrusion_multiplier * v.extrusion_multiplier_correction
-            v.material_extruded_per_color[
-                v.current_tool] += self.E * v.extrusion_multiplier * v.extrusion_multiplier_correction
-
-        v.processed_gcode.append(s)
+        self.account_extrusion()
+        issue(s)
 
     def add_comment(self, text):
         if self.Comment:
@@ -238,6 +203,202 @@ class GCodeCommand:
             return self.fullcommand == "G11"
 
 
+def parse_value(val):
+    # parameter value as found in the GCode: int, float or the text when it is not a number
+    try:
+        if "." in val:
+            return float(val)
+        return int(val)
+    except ValueError:
+        return val
+
+
+def render(fullcommand, parameters, comment, movement):
+    p = ""
+
+    # use the same formatting as prusa to ease file compares (X, Y, Z, E, F)
+
+    if movement:
+        for key in "XYZE":
+            if key in parameters:
+                value = parameters[key]
+                if value is None:
+                    gui.log_warning("GCode error detected, file might not print correctly")
+                    value = ""
+                p += format_fixed(key, value)
+
+    for key in parameters:
+        if not movement or key not in "XYZE":
+            value = parameters[key]
+            if value is None:
+                value = ""
+
+            p += "%s%s " % (key, value)
+
+    c = fullcommand
+    if not c:
+        c = ""
+
+    if not comment:
+        co = ""
+    else:
+        co = ";" + comment
+
+    return ("{} {} {}".format(c, p, co)).strip() + "\n"
+
+
+def account_extrusion(e):
+    add_material(e * v.extrusion_multiplier * v.extrusion_multiplier_correction)
+
+
+def add_material(extrusion):
+    # the splice and ping positions are taken from a sum over every extruding move of the print.  The total uses
+    # compensated (Neumaier) summation: the low order bits lost in each addition are collected separately, so
+    # the result does not drift with the length of the print
+    total = v.total_material_extruded_sum + extrusion
+    if abs(v.total_material_extruded_sum) >= abs(extrusion):
+        v.total_material_extruded_error += (v.total_material_extruded_sum - total) + extrusion
+    else:
+        v.total_material_extruded_error += (extrusion - total) + v.total_material_extruded_sum
+    v.total_material_extruded_sum = total
+    v.total_material_extruded = total + v.total_material_extruded_error
+    v.material_extruded_per_color[v.current_tool] += extrusion
+
+
+# in analysis mode (v.analyze) commands leaving the pending buffer are dropped instead of rendered
+
+def issue(entry):
+    pending_commands.append(entry)
+    if len(pending_commands) > PENDING_COMMANDS:
+        entry = pending_commands.popleft()
+        if not v.analyze:
+            v.processed_gcode.append(str(entry))
+
+
+def issue_lines(lines):
+    if len(lines) >= PENDING_COMMANDS:
+        flush_output()
+        if not v.analyze:
+            v.processed_gcode.extend(lines[:-PENDING_COMMANDS])
+        pending_commands.extend(lines[-PENDING_COMMANDS:])
+    else:
+        for line in lines:
+            issue(line)
+
+
+def flush_output():
+    if v.analyze:
+        pending_commands.clear()
+        return
+    while pending_commands:
+        v.processed_gcode.append(str(pending_commands.popleft()))
+
+
 def issue_code(s):
     GCodeCommand(s).issue_command()
 
+
+class GCodeTemplate:
+    # generated GCode with a fixed layout.  Issuing a template gives the same result as issue_code with the formatted
+    # line, but the template is parsed only once: the command, the parameters and the comment are split up front and
+    # issue only formats the arguments into the parameters that have a field
+    #
+    # a template that can't be split up front (a field in the command) and arguments that format to more than one
+    # parameter (a space or a ";" in the value) fall back to issue_code
+
+    def __init__(self, template):
+        self.template = template
+        self.command = None
+        self.movement = False
+        self.parameters = None  # [(key, value, format)], key None when the key comes from the field
+        self.comment = None
+        self.text = None
+        self.e = None
+
+        code = []
+        comment = None
+        field = 0
+        has_fields = False
+        for literal, name, spec, conversion in Formatter().parse(template):
+            literal = literal.replace("{", "{{").replace("}", "}}")
+            if comment is None and ";" in literal:
+                pos = literal.find(";")
+                code.append(literal[:pos])
+                comment = [literal[pos + 1:]]
+            elif comment is None:
+                code.append(literal)
+            else:
+                comment.append(literal)
+            if name is not None:
+                has_fields = True
+                if name == "":
+                    name = str(field)
+                    field += 1
+                name = "{" + name + ("!" + conversion if conversion else "") + (":" + spec if spec else "") + "}"
+                (code if comment is None else comment).append(name)
+
+        tokens = [token for token in "".join(code).strip().split(" ") if token]
+        if comment is not None:
+            self.comment = "".join(comment)
+
+        if any("{{" in token or "}}" in token for token in tokens):
+            return
+        if tokens:
+            if "{" in tokens[0]:
+                return
+            self.command = tokens[0]
+            self.movement = self.command[0] == "G" and self.command[1:] in ['0', '1', '2', '3', '5', '10', '11']
+
+        parameters = []
+        for token in tokens[1:]:
+            if "{" not in token:
+                parameters.append((token[0], parse_value(token[1:]), None))
+            elif token.startswith("{"):
+                parameters.append((None, None, token))
+            else:
+                parameters.append((token[0], None, token[1:]))
+        self.parameters = parameters
+
+        if not has_fields:
+            # no arguments, the line is always the same
+            self.text, self.e = self.render(())
+
+    def render(self, args):
+        # the rendered line and the extrusion, None when the arguments don't fit the template
+        parameters = {}
+        for key, value, spec in self.parameters:
+            if spec is not None:
+                value = spec.format(*args)
+                if " " in value or ";" in value:
+                    return None, None
+                if key is None:
+                    if not value:
+                        continue
+                    key = value[0]
+                    value = value[1:]
+                value = parse_value(value)
+            parameters[key] = value
+
+        comment = None
+        if self.comment is not None:
+            comment = self.comment.format(*args).rstrip()
+
+        e = None
+        if self.movement:
+            e = parameters.get("E")
+        return render(self.command, parameters, comment, self.movement), e
+
+    def issue(self, *args):
+        if self.text is not None:
+            text, e = self.text, self.e
+        elif self.parameters is None:
+            issue_code(self.template.format(*args))
+            return
+        else:
+            text, e = self.render(args)
+            if text is None:
+                issue_code(self.template.format(*args))
+                return
+        if e is not None:
+            account_extrusion(e)
+        issue(text)
@@ -50,10 +50,14 @@ def filament_volume_to_length(x):
     return x / (v.filament_diameter[v.current_tool] / 2 * v.filament_diameter[v.current_tool] / 2 * math.pi)
 
 
-def parse_slic3r_config():
-    for idx in range(len(v.input_gcode) - 1, -1, -1):
+def parse_slic3r_config(config_lines=None):
+    # config_lines: the slicer configuration when it is not part of the GCode (binary gcode files)
+    if config_lines is None:
+        config_lines = v.input_gcode
 
-        gcode_line = v.input_gcode[idx]
+    for idx in range(len(config_lines) - 1, -1, -1):
+
+        gcode_line = config_lines[idx]
 
         if ("generated by PrusaSlicer") in gcode_line:
             try:
@@ -13,10 +13,14 @@ try:
     import ttk
     import tkMessageBox
 except ImportError:
-    # python version 3.x
-    import tkinter
-    from tkinter import ttk
-    from tkinter import messagebox as tkMessageBox
+    try:
+        # python version 3.x
+        import tkinter
+        from tkinter import ttk
+        from tkinter import messagebox as tkMessageBox
+    except ImportError:
+        # no tkinter available, only headless (console) operation is possible
+        tkinter = None
 
 import os
 import sys
@@ -30,6 +34,15 @@ platformD = system()
 
 last_pct = -1
 
+# the main window is only created on request, without it all output goes to log_stream
+mainwindow = None
+log_stream = sys.stderr
+
+
+def console_log(text):
+    log_stream.write(text + "\n")
+    log_stream.flush()
+
 
 def print_summary(summary):
     create_logitem("")
@@ -61,6 +74,14 @@ def progress_string(pct):
     global last_pct
     if last_pct == pct:
         return
+    if mainwindow is None:
+        if pct == 100:
+            if len(v.process_warnings) == 0:
+                console_log("COMPLETED OK")
+            else:
+                console_log("COMPLETED WITH WARNINGS")
+        last_pct = pct
+        return
     if pct == 100:
         if len(v.process_warnings) == 0:
             completed("  COMPLETED OK", '#008000')
@@ -79,8 +100,11 @@ def completed(text, color):
 color_count = 0
 
 
-def create_logitem(text, color="black", force_update=True, position=tkinter.END):
+def create_logitem(text, color="black", force_update=True, position="end"):
     text = text.strip()
+    if mainwindow is None:
+        console_log(text)
+        return
     global color_count
     color_count += 1
     tagname = "color"+str(color_count)
@@ -90,6 +114,10 @@ def create_logitem(text, color="black", force_update=True, position=tkinter.END)
         mainwindow.update()
 
 def create_colordefinition(input, filament_type, color_code, filamentused):
+    if mainwindow is None:
+        console_log("\tInput  {} {:-8.2f}mm - {} \t{}".format(input, filamentused, filament_type,
+                                                            colornames.find_nearest_colour(color_code)))
+        return
     global color_count
     color_count += 1
     tagname = "color" + str(color_count)
@@ -112,6 +140,8 @@ def update_button_pressed():
     v.upgradeprocess(version.latest_stable_version , v.update_file_list)
 
 def close_button_enable():
+    if mainwindow is None:
+        return
     closebutton.config(state=tkinter.NORMAL)
     # WIP disable upgrade for now
     # if not (v.upgradeprocess == None):
@@ -129,20 +159,29 @@ def center(win, width, height):
 
 
 def set_printer_id(text):
+    if mainwindow is None:
+        return
     printerid.set(text)
     mainwindow.update()
 
 
 def setfilename(text):
+    if mainwindow is None:
+        return
     filename.set(text)
     mainwindow.update()
 
 
 def user_error(header, body_text):
+    if mainwindow is None:
+        console_log("{}: {}".format(header, body_text))
+        return
     tkMessageBox.showinfo(header, body_text)
 
 
 def ask_yes_no(title, message):
+    if mainwindow is None:
+        return False
     return (tkMessageBox.askquestion(title, message).upper()=="YES")
 
 
@@ -160,95 +199,99 @@ def configinfo():
     tkinter.Label(infosubframe, text="P2PP Version "+version.Version+"\n", font=boldfont, background="#909090").pack( side=tkinter.BOTTOM)
 
 
-mainwindow = tkinter.Tk()
-mainwindow.title("Palette2 Post Processing for PrusaSliceer")
-center(mainwindow, 800, 620)
+def create_window():
+    global mainwindow, boldfontlarge, normalfont, boldfont, fixedfont, fixedsmallfont, logo_image, logoimage
+    global infoframe, logofield, infosubframe, filename, printerid, progress, progressbar
+    global logframe, yloglistscroll, xloglistscroll, loglist, buttonframe, closebutton
 
-if platformD == 'Windows':
-    logo_image = os.path.dirname(sys.argv[0]) + '\\favicon.ico'
-    mainwindow.iconbitmap(logo_image)
-    mainwindow.update()
+    mainwindow = tkinter.Tk()
+    mainwindow.title("Palette2 Post Processing for PrusaSliceer")
+    center(mainwindow, 800, 620)
 
-mainwindow['padx'] = 10
-mainwindow['pady'] = 10
-boldfontlarge = 'Helvetica 30 bold'
-normalfont = 'Helvetica 15'
-boldfont = 'Helvetica 15 bold'
-fixedfont = 'Courier 14'
-fixedsmallfont = 'Courier 12'
-
-# Top Information Frqme
-infoframe = tkinter.Frame(mainwindow, border=3, relief='flat', background="#808080")
-infoframe.pack(side=tkinter.TOP, fill=tkinter.X)
-
-# logo
-logoimage = tkinter.PhotoImage(file=os.path.dirname(sys.argv[0]) + "/appicon.ppm")
-logofield = tkinter.Label(infoframe, image=logoimage)
-logofield.pack(side=tkinter.LEFT, fill=tkinter.Y)
-
-infosubframe = tkinter.Frame(infoframe, relief='flat', background="#808080")
-infosubframe.pack(side=tkinter.LEFT, fill=tkinter.X, )
-infosubframe["padx"] = 20
-
-# file name display
-tkinter.Label(infosubframe, text='Filename:', font=boldfont, background="#808080").grid(row=0, column=1, sticky="w")
-filename = tkinter.StringVar()
-setfilename("-----")
-tkinter.Label(infosubframe, textvariable=filename, font=normalfont, background="#808080").grid(row=0, column=2,
-                                                                                               sticky="w")
-
-# printer ID display
-printerid = tkinter.StringVar()
-set_printer_id("-----")
-
-tkinter.Label(infosubframe, text='Printer ID:', font=boldfont, background="#808080").grid(row=1, column=1, sticky="w")
-tkinter.Label(infosubframe, textvariable=printerid, font=normalfont, background="#808080").grid(row=1, column=2,
-                                                                                                sticky="w")
+    if platformD == 'Windows':
+        logo_image = os.path.dirname(sys.argv[0]) + '\\favicon.ico'
+        mainwindow.iconbitmap(logo_image)
+        mainwindow.update()
+
+    mainwindow['padx'] = 10
+    mainwindow['pady'] = 10
+    boldfontlarge = 'Helvetica 30 bold'
+    normalfont = 'Helvetica 15'
+    boldfont = 'Helvetica 15 bold'
+    fixedfont = 'Courier 14'
+    fixedsmallfont = 'Courier 12'
+
+    # Top Information Frqme
+    infoframe = tkinter.Frame(mainwindow, border=3, relief='flat', background="#808080")
+    infoframe.pack(side=tkinter.TOP, fill=tkinter.X)
+
+    # logo
+    logoimage = tkinter.PhotoImage(file=os.path.dirname(sys.argv[0]) + "/appicon.ppm")
+    logofield = tkinter.Label(infoframe, image=logoimage)
+    logofield.pack(side=tkinter.LEFT, fill=tkinter.Y)
 
+    infosubframe = tkinter.Frame(infoframe, relief='flat', background="#808080")
+    infosubframe.pack(side=tkinter.LEFT, fill=tkinter.X, )
+    infosubframe["padx"] = 20
 
-tkinter.Label(infosubframe, text="P2PP Version:", font=boldfont, background="#808080").grid(row=2, column=1,
-                                                                                            sticky="w")
-tkinter.Label(infosubframe, text=version.Version, font=normalfont, background="#808080").grid(row=2, column=2,
-                                                                                              sticky="w")
+    # file name display
+    tkinter.Label(infosubframe, text='Filename:', font=boldfont, background="#808080").grid(row=0, column=1, sticky="w")
+    filename = tkinter.StringVar()
+    setfilename("-----")
+    tkinter.Label(infosubframe, textvariable=filename, font=normalfont, background="#808080").grid(row=0, column=2,
+                                                                                                   sticky="w")
 
-# progress bar
-progress = tkinter.IntVar()
-progress.set(0)
-tkinter.Label(infosubframe, text='Progress:', font=boldfont, background="#808080").grid(row=3, column=1, sticky="w")
-progressbar = ttk.Progressbar(infosubframe ,orient='horizontal', mode='determinate', length=500, maximum=100, variable=progress)
-progressbar.grid(row=3, column=2,  sticky='ew')
+    # printer ID display
+    printerid = tkinter.StringVar()
+    set_printer_id("-----")
 
+    tkinter.Label(infosubframe, text='Printer ID:', font=boldfont, background="#808080").grid(row=1, column=1, sticky="w")
+    tkinter.Label(infosubframe, textvariable=printerid, font=normalfont, background="#808080").grid(row=1, column=2,
+                                                                                                    sticky="w")
 
-# Log frame
-logframe = tkinter.Frame(mainwindow, border=3, relief="sunken")
-logframe.pack(side=tkinter.TOP, fill=tkinter.BOTH, expand=1)
 
-yloglistscroll = tkinter.Scrollbar(logframe, orient=tkinter.VERTICAL)
-yloglistscroll.pack(side='right', fill=tkinter.Y)
+    tkinter.Label(infosubframe, text="P2PP Version:", font=boldfont, background="#808080").grid(row=2, column=1,
+                                                                                                sticky="w")
+    tkinter.Label(infosubframe, text=version.Version, font=normalfont, background="#808080").grid(row=2, column=2,
+                                                                                                  sticky="w")
+
+    # progress bar
+    progress = tkinter.IntVar()
+    progress.set(0)
+    tkinter.Label(infosubframe, text='Progress:', font=boldfont, background="#808080").grid(row=3, column=1, sticky="w")
+    progressbar = ttk.Progressbar(infosubframe ,orient='horizontal', mode='determinate', length=500, maximum=100, variable=progress)
+    progressbar.grid(row=3, column=2,  sticky='ew')
+
 
-xloglistscroll = tkinter.Scrollbar(logframe, orient=tkinter.HORIZONTAL)
-xloglistscroll.pack(side='bottom', fill=tkinter.X)
+    # Log frame
+    logframe = tkinter.Frame(mainwindow, border=3, relief="sunken")
+    logframe.pack(side=tkinter.TOP, fill=tkinter.BOTH, expand=1)
 
-loglist = tkinter.Text(logframe, yscrollcommand=yloglistscroll.set, xscrollcommand=xloglistscroll.set, wrap="none",
-                       font=fixedsmallfont)
-loglist.pack(side=tkinter.LEFT, fill=tkinter.BOTH, expand=True)
+    yloglistscroll = tkinter.Scrollbar(logframe, orient=tkinter.VERTICAL)
+    yloglistscroll.pack(side='right', fill=tkinter.Y)
 
-yloglistscroll.config(command=loglist.yview)
-xloglistscroll.config(command=loglist.xview)
+    xloglistscroll = tkinter.Scrollbar(logframe, orient=tkinter.HORIZONTAL)
+    xloglistscroll.pack(side='bottom', fill=tkinter.X)
 
-# Button frame
-buttonframe = tkinter.Frame(mainwindow, border=1, relief="flat")
-buttonframe.pack(side=tkinter.BOTTOM, fill=tkinter.X)
+    loglist = tkinter.Text(logframe, yscrollcommand=yloglistscroll.set, xscrollcommand=xloglistscroll.set, wrap="none",
+                           font=fixedsmallfont)
+    loglist.pack(side=tkinter.LEFT, fill=tkinter.BOTH, expand=True)
 
-closebutton = tkinter.Button(buttonframe, text="Exit", state=tkinter.DISABLED, command=close_window, height=2)
-closebutton.pack(fill=tkinter.BOTH, expand=True)
+    yloglistscroll.config(command=loglist.yview)
+    xloglistscroll.config(command=loglist.xview)
 
-mainwindow.rowconfigure(0, weight=1000)
-mainwindow.rowconfigure(1, weight=2)
-mainwindow.rowconfigure(2, weight=1000)
+    # Button frame
+    buttonframe = tkinter.Frame(mainwindow, border=1, relief="flat")
+    buttonframe.pack(side=tkinter.BOTTOM, fill=tkinter.X)
 
-mainwindow.lift()
-mainwindow.attributes('-topmost', True)
-mainwindow.after_idle(mainwindow.attributes, '-topmost', False)
-mainwindow.update()
+    closebutton = tkinter.Button(buttonframe, text="Exit", state=tkinter.DISABLED, command=close_window, height=2)
+    closebutton.pack(fill=tkinter.BOTH, expand=True)
 
+    mainwindow.rowconfigure(0, weight=1000)
+    mainwindow.rowconfigure(1, weight=2)
+    mainwindow.rowconfigure(2, weight=1000)
+
+    mainwindow.lift()
+    mainwindow.attributes('-topmost', True)
+    mainwindow.after_idle(mainwindow.attributes, '-topmost', False)
+    mainwindow.update()
@@ -7,10 +7,15 @@ __license__ = 'GPLv3'
 __maintainer__ = 'Tom Van den Eede'
 __email__ = 'P2PP@pandora.be'
 
+import gzip
 import io
 import os
+import sys
 import time
 
+import p2pp.atomicfile as atomicfile
+import p2pp.bgcode as bgcode
+import p2pp.compact as compact
 import p2pp.gcode as gcode
 import p2pp.gui as gui
 import p2pp.parameters as parameters
@@ -21,21 +26,157 @@ from p2pp.gcodeparser import parse_slic3r_config
 from p2pp.omega import header_generate_omega, algorithm_process_material_configuration
 from p2pp.sidewipe import create_side_wipe, create_sidewipe_BigBrain3D
 
+try:
+    import zstandard
+except ImportError:
+    # zstd compressed files are only supported when the zstandard module is installed
+    zstandard = None
 
-def remove_previous_move_in_tower():
-    idx = len(v.processed_gcode) - 10
 
-    while idx < len(v.processed_gcode):
-        line = v.processed_gcode[idx]
-        tmp = gcode.GCodeCommand(line)
+# file name used to read the input from stdin or write the output to stdout
+STDIO = "-"
+
+# compressed files are recognized by their magic number when reading and by their extension when writing
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+COMPRESSION_EXTENSIONS = (".gz", ".zst")
+
+
+def stdio_stream(stream):
+    # python 3.x: standard input/output with the same encoding as regular files
+    if hasattr(stream, "buffer"):
+        return io.TextIOWrapper(stream.buffer, encoding='utf-8')
+    return stream
+
+
+def close_stream(stream, filename):
+    if filename != STDIO:
+        stream.close()
+    else:
+        stream.flush()
+        # leave the underlying standard stream open
+        if hasattr(stream, "detach"):
+            stream.detach()
+
+
+def split_compression(filename):
+    # returns the file name without compression extension and the compression extension ("" if none)
+    name, ext = os.path.splitext(filename)
+    if ext.lower() in COMPRESSION_EXTENSIONS:
+        return name, ext.lower()
+    return filename, ""
+
+
+def decompress(data):
+    if data[:2] == GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=io.BytesIO(data)).read()
+    if data[:4] == ZSTD_MAGIC:
+        if zstandard is None:
+            raise IOError("zstd compressed input requires the zstandard module (pip install zstandard)")
+        return zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)).read()
+    return data
+
+
+class OutputFile:
+    # text stream to filename, compressed when the file name ends in .gz or .zst.  The data is written to a
+    # temporary file that replaces filename when the stream is closed
+
+    def __init__(self, filename, newline=None):
+        self.file = atomicfile.AtomicFile(filename)
+        compression = split_compression(filename)[1]
+        if compression == ".gz":
+            self.stream = gzip.GzipFile(os.path.basename(filename), "wb", 6, self.file)
+        elif compression == ".zst":
+            if zstandard is None:
+                self.file.discard()
+                raise IOError("zstd compressed output requires the zstandard module (pip install zstandard)")
+            self.stream = zstandard.ZstdCompressor().stream_writer(self.file)
+        else:
+            self.stream = self.file
+
+        # same line endings as a file opened in text mode
+        if newline is None:
+            newline = os.linesep
+        self.newline = newline
+
+    def write(self, text):
+        if self.newline != "\n":
+            text = text.replace("\n", self.newline)
+        if not isinstance(text, bytes):
+            text = text.encode('utf-8')
+        self.stream.write(text)
+
+    def writelines(self, lines):
+        # encode in blocks of lines rather than line by line
+        for idx in range(0, len(lines), 1000):
+            self.write("".join(lines[idx:idx + 1000]))
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        if self.stream is not self.file:
+            try:
+                self.stream.close()
+            except Exception:
+                self.discard()
+                raise
+        self.file.close()
+
+    def discard(self):
+        self.file.discard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+def read_gcode_lines(input_file):
+    # the file is read and decoded in one go, splitting the decoded text saves a decode and a copy
+    # per line.  Lines are split the way text mode files do (universal newlines) and stripped, strip()
+    # returns the line itself when there is nothing to strip
+    if input_file == STDIO:
+        data = getattr(sys.stdin, "buffer", sys.stdin).read()
+    else:
+        with open(input_file, "rb") as opf:
+            data = opf.read()
+
+    data = decompress(data)
+
+    if bgcode.is_bgcode(data):
+        v.bgcode_input = bgcode.read(data)
+        data = v.bgcode_input["gcode"]
+
+    if not isinstance(data, str):
+        # python 3.x
+        data = data.decode('utf-8')
+
+    if "\r" in data:
+        data = data.replace("\r\n", "\n").replace("\r", "\n")
+
+    lines = data.split("\n")
+    if lines[-1] == "":
+        lines.pop()
+    return [line.strip() for line in lines]
+
+
+def remove_previous_move_in_tower():
+    # the last issued commands are still pending as objects, so they can be updated in place
+    for idx in range(len(gcode.pending_commands)):
+        tmp = gcode.pending_commands[idx]
+        if not isinstance(tmp, gcode.GCodeCommand):
+            tmp = gcode.GCodeCommand(tmp)
         if tmp.X and tmp.Y:
             if coordinate_in_tower(tmp.X, tmp.Y):
                 if tmp.is_movement_command() and tmp.has_E():
-                    v.total_material_extruded -= tmp.E
-                    v.material_extruded_per_color[v.current_tool] -= tmp.E
+                    gcode.add_material(-tmp.E)
                 tmp.move_to_comment("tower skipped")
-                v.processed_gcode[idx] = tmp.__str__()
-        idx = idx + 1
+                gcode.pending_commands[idx] = tmp
 
 
 def optimize_tower_skip(skipmax, layersize):
@@ -98,6 +239,16 @@ def convert_to_absolute():
 
 
 # ################### GCODE PROCESSING ###########################
+def register_transition(from_input, to_input, splice):
+    length = v.splice_length[splice]
+    count = v.transition_count[from_input][to_input]
+    if count == 0 or length < v.transition_min_length[from_input][to_input]:
+        v.transition_min_length[from_input][to_input] = length
+        v.transition_shortest_splice[from_input][to_input] = splice
+    v.transition_count[from_input][to_input] = count + 1
+    v.transition_length[from_input][to_input] += length
+
+
 def gcode_process_toolchange(new_tool, location, current_layer):
     # some commands are generated at the end to unload filament,
     # they appear as a reload of current filament - messing up things
@@ -108,8 +259,7 @@ def gcode_process_toolchange(new_tool, location, current_layer):
 
     if new_tool == -1:
         location += v.extra_runout_filament
-        v.material_extruded_per_color[v.current_tool] += v.extra_runout_filament
-        v.total_material_extruded += v.extra_runout_filament
+        gcode.add_material(v.extra_runout_filament)
     else:
         v.palette_inputs_used[new_tool] = True
 
@@ -149,6 +299,9 @@ def gcode_process_toolchange(new_tool, location, current_layer):
 
         v.previous_toolchange_location = v.splice_extruder_position[-1]
 
+        if len(v.splice_used_tool) > 1:
+            register_transition(v.splice_used_tool[-2], v.splice_used_tool[-1], len(v.splice_length) - 1)
+
     v.previous_tool = v.current_tool
     v.current_tool = new_tool
 
@@ -186,39 +339,42 @@ def y_coordinate_in_tower(y):
 def coordinate_in_tower(x, y):
     return x_coordinate_in_tower(x) and y_coordinate_in_tower(y)
 
+DELTA_SEPARATOR = gcode.GCodeTemplate(";------------------------------\n")
+DELTA_ENTER = gcode.GCodeTemplate(";  P2PP DELTA ENTER\n")
+DELTA_ENTER_HEIGHTS = gcode.GCodeTemplate(";  Current Z-Height = {:.2f};  Tower height = {:.2f}; delta = {:.2f}")
+DELTA_LEAVE = gcode.GCodeTemplate(";  P2PP DELTA LEAVE\n")
+DELTA_LEAVE_HEIGHT = gcode.GCodeTemplate(";  Returning to Current Z-Height = {:.2f}; ")
+DELTA_Z = gcode.GCodeTemplate("G1 Z{:.2f} F10810\n")
+DELTA_SPEED = gcode.GCodeTemplate("G1 F{}\n")
+
+
 def entertower(layer_hght):
     if v.cur_tower_z_delta > 0:
         purgeheight = layer_hght - v.cur_tower_z_delta
         v.max_tower_delta = max(v.cur_tower_z_delta, v.max_tower_delta)
-        gcode.issue_code(";------------------------------\n")
-        gcode.issue_code(";  P2PP DELTA ENTER\n")
-        gcode.issue_code(
-            ";  Current Z-Height = {:.2f};  Tower height = {:.2f}; delta = {:.2f}".format(v.current_position_z,
-                                                                                          purgeheight,
-                                                                                          v.current_position_z - purgeheight))
+        DELTA_SEPARATOR.issue()
+        DELTA_ENTER.issue()
+        DELTA_ENTER_HEIGHTS.issue(v.current_position_z, purgeheight, v.current_position_z - purgeheight)
         if v.retraction >= 0:
             purgetower.retract(v.current_tool)
-        gcode.issue_code(
-            "G1 Z{:.2f} F10810\n".format(purgeheight))
+        DELTA_Z.issue(purgeheight)
 
         # purgetower.unretract(v.current_tool)
 
-        gcode.issue_code(";------------------------------\n")
+        DELTA_SEPARATOR.issue()
         if purgeheight <= 0.21:
-            gcode.issue_code("G1 F{}\n".format(min(1200, v.wipe_feedrate)))
+            DELTA_SPEED.issue(min(1200, v.wipe_feedrate))
         else:
-            gcode.issue_code("G1 F{}\n".format(v.wipe_feedrate))
+            DELTA_SPEED.issue(v.wipe_feedrate)
 
 
 def leavetower():
     if v.cur_tower_z_delta > 0:
-        gcode.issue_code(";------------------------------\n")
-        gcode.issue_code(";  P2PP DELTA LEAVE\n")
-        gcode.issue_code(
-            ";  Returning to Current Z-Height = {:.2f}; ".format(v.current_position_z))
-        gcode.issue_code(
-            "G1 Z{:.2f} F10810\n".format(v.current_position_z))
-        gcode.issue_code(";------------------------------\n")
+        DELTA_SEPARATOR.issue()
+        DELTA_LEAVE.issue()
+        DELTA_LEAVE_HEIGHT.issue(v.current_position_z)
+        DELTA_Z.issue(v.current_position_z)
+        DELTA_SEPARATOR.issue()
 
 CLS_UNDEFINED = 0
 CLS_NORMAL = 1
@@ -342,12 +498,13 @@ def parse_gcode():
     v.block_classification = CLS_NORMAL
     v.previous_block_classification = CLS_NORMAL
     total_line_count = len(v.input_gcode)
+    progress_step = max(1, total_line_count // 46)
 
     index = 0
     for line in v.input_gcode:
 
-        gui.progress_string(4 + 46 * index // total_line_count)
-
+        if index % progress_step == 0:
+            gui.progress_string(4 + 46 * index // total_line_count)
 
         if line.startswith(';'):
 
@@ -636,7 +793,7 @@ def gcode_parseline(index):
         if classupdate and g.Class in [CLS_TOOL_PURGE, CLS_EMPTY]:
 
             if v.acc_ping_left <= 0:
-                pings.check_accessorymode_first()
+                pings.check_accessorymode_first(index)
             v.enterpurge = True
 
         if v.enterpurge and g.is_movement_command():
@@ -765,10 +922,12 @@ def gcode_parseline(index):
     ###################
 
     if v.accessory_mode:
-        pings.check_accessorymode_second(g.E)
+        pings.check_accessorymode_second(g)
 
     if (g.has_E() and g.E > 0) and v.side_wipe_length == 0:
         pings.check_connected_ping()
+    elif v.ping_window > 0 and v.side_wipe_length == 0 and pings.pause_point(g):
+        pings.check_connected_ping(True)
 
     v.previous_position_x = v.current_position_x
     v.previous_position_y = v.current_position_y
@@ -779,30 +938,22 @@ def gcode_parseline(index):
 def generate(input_file, output_file, printer_profile, splice_offset, silent):
     starttime = time.time()
     v.printer_profile_string = printer_profile
-    basename = os.path.basename(input_file)
+    if input_file == STDIO:
+        basename = "stdin"
+    else:
+        basename = os.path.basename(split_compression(input_file)[0])
     _taskName = os.path.splitext(basename)[0].replace(" ", "_")
     _taskName = _taskName.replace(".mcf", "")
 
     v.splice_offset = splice_offset
 
     try:
-        # python 3.x
-        opf = open(input_file, encoding='utf-8')
-    except TypeError:
-        try:
-            # python 2.x
-            opf = open(input_file)
-        except IOError:
-            if v.gui:
-                gui.user_error("P2PP - Error Occurred", "Could not read input file\n'{}'".format(input_file))
-            else:
-                print ("Could not read input file\n'{}".format(input_file))
-            return
-    except IOError:
+        input_gcode = read_gcode_lines(input_file)
+    except (IOError, EOFError) as e:
         if v.gui:
-            gui.user_error("P2PP - Error Occurred", "Could not read input file\n'{}'".format(input_file))
+            gui.user_error("P2PP - Error Occurred", "Could not read input file\n'{}'\n{}".format(input_file, e))
         else:
-            print ("Could not read input file\n'{}".format(input_file))
+            gui.console_log("Could not read input file\n'{}'\n{}".format(input_file, e))
         return
 
     gui.setfilename(input_file)
@@ -810,14 +961,14 @@ def generate(input_file, output_file, printer_profile, splice_offset, silent):
     gui.create_logitem("Reading File " + input_file)
     gui.progress_string(1)
 
-    v.input_gcode = opf.readlines()
-    opf.close()
-
-    v.input_gcode = [item.strip() for item in v.input_gcode]
+    v.input_gcode = input_gcode
 
     gui.create_logitem("Analyzing slicer parameters")
     gui.progress_string(2)
-    parse_slic3r_config()
+    if v.bgcode_input:
+        parse_slic3r_config(bgcode.config_lines(v.bgcode_input))
+    else:
+        parse_slic3r_config()
 
     gui.create_logitem("Pre-parsing GCode")
     gui.progress_string(4)
@@ -874,18 +1025,33 @@ def generate(input_file, output_file, printer_profile, splice_offset, silent):
 
         gui.create_logitem("Generate processed GCode")
 
+        # the rewrite is a single pass: splice and ping positions, retraction state and the
+        # generated purge sequences all depend on what was emitted for the preceding lines
         total_line_count = len(v.input_gcode)
+        progress_step = max(1, total_line_count // 50)
         v.retraction = 0
+
         for process_line_count in range(total_line_count):
             gcode_parseline(process_line_count)
-            gui.progress_string(50 + 50 * process_line_count // total_line_count)
+            if process_line_count % progress_step == 0:
+                gui.progress_string(50 + 50 * process_line_count // total_line_count)
 
+        gcode.flush_output()
         v.processtime = time.time() - starttime
 
+        if v.accessory_mode:
+            gui.create_logitem("Accessory mode pings: {} pings, {:.0f}s of pauses added"
+                               .format(len(v.ping_extrusion_between_pause), v.acc_ping_dwell_time))
+
         gcode_process_toolchange(-1, v.total_material_extruded, 0)
         omega_result = header_generate_omega(_taskName)
         header = omega_result['header'] + omega_result['summary'] + omega_result['warnings']
 
+        if v.analyze:
+            # the results are reported by p2pp.analyze, no output files are written
+            v.omega_result = omega_result
+            return
+
         if v.absolute_extruder and v.gcode_has_relative_e:
             gui.create_logitem("Converting to absolute extrusion")
             convert_to_absolute()
@@ -895,30 +1061,56 @@ def generate(input_file, output_file, printer_profile, splice_offset, silent):
 
         if not output_file:
             output_file = input_file
-        gui.create_logitem("Generating GCODE file: " + output_file)
-        opf = open(output_file, "w")
-        if not v.accessory_mode:
-            opf.writelines(header)
-            opf.write("\n\n;--------- START PROCESSED GCODE ----------\n\n")
-        if v.accessory_mode:
-            opf.write("M0\n")
-            opf.write("T0\n")
-
-        if v.splice_offset == 0:
-            gui.log_warning("SPLICE_OFFSET not defined")
-        opf.writelines(v.processed_gcode)
-        opf.close()
-
-        if v.accessory_mode:
-
-            pre, ext = os.path.splitext(output_file)
+        if output_file == STDIO:
+            gui.create_logitem("Writing GCODE to standard output")
+            opf = stdio_stream(sys.stdout)
+        else:
+            gui.create_logitem("Generating GCODE file: " + output_file)
+            if output_file.lower().endswith(".bgcode"):
+                opf = bgcode.BGCodeWriter(output_file, v.bgcode_input or bgcode.from_ascii(v.input_gcode))
+            else:
+                opf = OutputFile(output_file)
+        try:
+            if not v.accessory_mode:
+                opf.writelines(header)
+                opf.write("\n\n;--------- START PROCESSED GCODE ----------\n\n")
+            if v.accessory_mode:
+                opf.write("M0\n")
+                opf.write("T0\n")
+
+            if v.splice_offset == 0:
+                gui.log_warning("SPLICE_OFFSET not defined")
+            if v.compact_output:
+                body = compact.CompactStream(opf, v.compact_output)
+            else:
+                body = opf
+            body.writelines(v.processed_gcode)
+            if v.compact_output:
+                gui.create_logitem("Compact output: {} -> {} bytes ({:.1f}% smaller)"
+                                   .format(body.size_in, body.size_out, body.reduction()))
+            if v.bgcode_input and not isinstance(opf, bgcode.BGCodeWriter):
+                # keep the slicer configuration in ASCII output of a binary gcode file
+                opf.writelines(bgcode.config_block(v.bgcode_input))
+            close_stream(opf, output_file)
+        except Exception:
+            # leave an existing output file untouched, no temporary file is left behind
+            if output_file != STDIO:
+                opf.discard()
+            raise
+
+        if v.accessory_mode and output_file == STDIO:
+            gui.log_warning("No MAF/MSF file generated when writing GCODE to standard output")
+        elif v.accessory_mode:
+
+            # the MAF/MSF file is compressed the same way as the GCode file
+            name, compression = split_compression(output_file)
+            pre, ext = os.path.splitext(name)
             if v.palette_plus:
-                maffile = pre + ".msf"
+                maffile = pre + ".msf" + compression
             else:
-                maffile = pre + ".maf"
+                maffile = pre + ".maf" + compression
             gui.create_logitem("Generating PALETTE MAF/MSF file: " + maffile)
-            # opf = open(maffile, "w")
-            with io.open('tmpfile', 'w', newline='\r\n') as opf:
+            with OutputFile(maffile, newline='\r\n') as opf:
                 for i in range(len(header)):
                     if not header[i].startswith(";"):
                         try:
@@ -47,26 +47,27 @@ def algorithm_process_material_configuration(splice_info):
 
 
 def algorithm_transition_used(from_input, to_input):
-    if len(v.splice_used_tool) > 0:
-        for idx in range(len(v.splice_used_tool) - 1):
-            if v.splice_used_tool[idx] == from_input and v.splice_used_tool[idx + 1] == to_input:
-                return True
-    return False
+    return v.transition_count[from_input][to_input] > 0
 
 
 def algorithm_create_table():
     splice_list = []
+
+    material_index = {}
+    for idx in range(len(v.used_filament_types)):
+        material_index.setdefault(v.used_filament_types[idx], idx + 1)
+
     for i in range(4):
         for j in range(4):
 
             if i == j:
                 continue
             try:
-                algo_key = "{}{}".format(v.used_filament_types.index(v.filament_type[i]) + 1,
-                                         v.used_filament_types.index(v.filament_type[j]) + 1)
+                algo_key = "{}{}".format(material_index[v.filament_type[i]],
+                                         material_index[v.filament_type[j]])
                 if algo_key in splice_list:
                     continue
-            except (IndexError, KeyError, ValueError):
+            except (IndexError, KeyError):
                 continue
 
             if not algorithm_transition_used(i, j):
@@ -102,7 +103,7 @@ def header_generate_omega(job_name):
             if gui.ask_yes_no('Not a Multi-Colour file?',
                               "This doesn't look like a multi-colour file. Skip processing?"):
                 exit(1)
-        else:
+        elif not v.headless:
             if yes_or_no("This does not look like a multi-colour file.. Skip P2PP Processing?\n"):
                 exit(1)
 
@@ -258,6 +259,26 @@ def generatesummary():
                                                             )
         summary.append( pingtext )
 
+    summary.append("\n")
+    summary.append(";-------------------------\n")
+    summary.append("; - TRANSITION INFORMATION-\n")
+    summary.append(";-------------------------\n")
+
+    for i in range(4):
+        for j in range(4):
+            count = v.transition_count[i][j]
+            if count == 0:
+                continue
+            summary.append(";Input {} to {}: {:4} transitions  total {:-9.2f}mm  shortest {:-8.2f}mm (splice {:04})\n"
+                           .format(i + 1,
+                                   j + 1,
+                                   count,
+                                   v.transition_length[i][j],
+                                   v.transition_min_length[i][j],
+                                   v.transition_shortest_splice[i][j] + 1
+                                   )
+                           )
+
     if v.side_wipe and v.side_wipe_loc == "" and not v.bigbrain3d_purge_enabled:
         gui.log_warning("Using sidewipe with undefined SIDEWIPELOC!!!")
 
@@ -7,9 +7,15 @@ __license__ = 'GPLv3'
 __maintainer__ = 'Tom Van den Eede'
 __email__ = 'P2PP@pandora.be'
 
+import copy
+import hashlib
+
 import p2pp.gui as gui
 import p2pp.variables as v
 
+# mm of extrusion a ping can be postponed (PINGWINDOW)
+MAX_PING_WINDOW = 50
+
 
 def floatparameter(s):
     try:
@@ -25,241 +31,265 @@ def intparameter(s):
         return 0
 
 
-def check_config_parameters(keyword, value):
-    keyword = keyword.upper()
-    if value is None:
-        value = ""
+def textparameter(s):
+    return s
 
-    if keyword == "PRINTERPROFILE":
 
-        if len(value) != 16:
-            gui.log_warning("Invalid Printer profile!  - Has invalid length (expect 16) - [{}]"
-                            .format(value))
-            value = ""
-        if not all(char in set("0123456789ABCDEFabcdef") for char in value):
-            gui.log_warning("Invalid Printer profile!  - Invalid characters  (expect 0123456789abcdef) - [{}]"
-                            .format(value))
-            value = ""
+def flagparameter(s):
+    return True
 
-        if len(value) == 16:
-            v.printer_profile_string = value
-            gui.set_printer_id(v.printer_profile_string)
-        return
 
-    if keyword == "ACCESSORYMODE_MAF":
-        v.accessory_mode = True
-        gui.create_logitem("Config: Palette2 Accessory Mode Selected")
-        return
+KIND_NAMES = {floatparameter: "float",
+              intparameter: "int",
+              textparameter: "text",
+              flagparameter: "flag"}
 
-    if keyword == "ACCESSORYMODE_MSF":
-        v.accessory_mode = True
-        v.palette_plus = True
-        gui.create_logitem("Config: Palette+ Accessory Mode Selected")
-        return
 
-    if keyword == "P+LOADINGOFFSET":
-        v.palette_plus_loading_offset = int(value)
-        return
+class Parameter:
+    # a ;P2PP configuration parameter.  The value is converted with kind and stored in variables.<target>,
+    # values below minimum are raised to minimum with a warning.  Parameters that need more than storing the
+    # value have a hook that is called with the converted value instead, target then only names the variable
+    # for reporting
 
-    if keyword == "P+PPM":
-        v.palette_plus_ppm = intparameter(value)
-        return
+    def __init__(self, name, kind=textparameter, target=None, minimum=None, warning=None, message=None, hook=None):
+        self.name = name
+        self.kind = kind
+        self.target = target
+        self.minimum = minimum
+        self.warning = warning
+        self.message = message
+        self.hook = hook
+        if target:
+            self.default = copy.copy(getattr(v, target))
+        else:
+            self.default = None
 
-    if keyword == "SPLICEOFFSET":
-        v.splice_offset = floatparameter(value)
-        gui.create_logitem("Splice Offset set to {:-5.2f}mm".format(v.splice_offset))
-        return
+    def apply(self, value):
+        value = self.kind(value)
+        if self.minimum is not None and value < self.minimum:
+            gui.log_warning(self.warning.format(value))
+            value = self.minimum
 
-    if keyword == "PROFILETYPEOVERRIDE":
-        v.filament_type[v.current_tool] = value
-        v.used_filament_types.append(v.filament_type[v.current_tool])
-        v.used_filament_types = list(dict.fromkeys(v.used_filament_types))
-        return
+        if self.hook:
+            self.hook(value)
+        else:
+            setattr(v, self.target, value)
 
-    if keyword == "EXTRUSIONMULTIPLIERCORRECTION":
-        v.filament_type[v.current_tool] = floatparameter(value)
-        return
+        if self.message:
+            gui.create_logitem(self.message.format(value))
 
-    if keyword == "EXTRAENDFILAMENT":
-        v.extra_runout_filament = floatparameter(value)
-        gui.create_logitem("Extra filament at end of print {:-8.2f}mm".format(v.extra_runout_filament))
-        return
+    def value(self):
+        if self.target:
+            return getattr(v, self.target)
+        return None
 
-    if keyword == "BEFORESIDEWIPEGCODE":
-        v.before_sidewipe_gcode.append(value)
-        return
 
-    if keyword == "AFTERSIDEWIPEGCODE":
-        v.after_sidewipe_gcode.append(value)
-        return
+def set_printer_profile(value):
+    if len(value) != 16:
+        gui.log_warning("Invalid Printer profile!  - Has invalid length (expect 16) - [{}]"
+                        .format(value))
+        value = ""
+    if not all(char in set("0123456789ABCDEFabcdef") for char in value):
+        gui.log_warning("Invalid Printer profile!  - Invalid characters  (expect 0123456789abcdef) - [{}]"
+                        .format(value))
+        value = ""
 
-    if keyword == "AUTOADDPURGE":
-        v.autoaddsplice = True
-        return
+    if len(value) == 16:
+        v.printer_profile_string = value
+        gui.set_printer_id(v.printer_profile_string)
 
-    if keyword == "MINSTARTSPLICE":
-        v.min_start_splice_length = floatparameter(value)
-        if v.min_start_splice_length < 100:
-            v.min_start_splice_length = 100
-            gui.log_warning("Minimal first slice length adjusted to 100mm")
-        return
 
-    if keyword == "BEDSIZEX":
-        v.bed_size_x = floatparameter(value)
-        return
+def set_accessory_mode_maf(value):
+    v.accessory_mode = True
+    gui.create_logitem("Config: Palette2 Accessory Mode Selected")
 
-    if keyword == "BEDSIZEY":
-        v.bed_size_y = floatparameter(value)
-        return
 
-    if keyword == "BEDORIGINX":
-        v.bed_origin_x = floatparameter(value)
-        return
+def set_accessory_mode_msf(value):
+    v.accessory_mode = True
+    v.palette_plus = True
+    gui.create_logitem("Config: Palette+ Accessory Mode Selected")
 
-    if keyword == "BEDORIGINY":
-        v.bed_origin_y = floatparameter(value)
-        return
 
-    if keyword == "BIGBRAIN3D_BLOBSIZE":
-        v.bigbrain3d_blob_size = intparameter(value)
-        return
+def set_profile_type_override(value):
+    v.filament_type[v.current_tool] = value
+    v.used_filament_types.append(v.filament_type[v.current_tool])
+    v.used_filament_types = list(dict.fromkeys(v.used_filament_types))
 
-    if keyword == "BIGBRAIN3D_COOLINGTIME":
-        v.bigbrain3d_blob_cooling_time = intparameter(value)
-        return
 
-    if keyword == "BIGBRAIN3D_PURGEPOSITION":
-        v.bigbrain3d_x_position = floatparameter(value)
-        return
+def add_before_sidewipe_gcode(value):
+    v.before_sidewipe_gcode.append(value)
 
-    if keyword == "BIGBRAIN3D_MOTORPOWER_HIGH":
-        v.bigbrain3d_motorpower_high = intparameter(value)
-        return
 
-    if keyword == "BIGBRAIN3D_MOTORPOWER_NORMAL":
-        v.bigbrain3d_motorpower_normal = intparameter(value)
-        return
+def add_after_sidewipe_gcode(value):
+    v.after_sidewipe_gcode.append(value)
 
-    if keyword == "BIGBRAIN3D_NUMBER_OF_WHACKS":
-        v.bigbrain3d_whacks = intparameter(value)
-        return
 
-    if keyword == "BIGBRAIN3D_PRIME_BLOBS":
-        v.bigbrain3d_prime = intparameter(value)
-        return
+def enable_bigbrain3d(value):
+    if not v.wipe_remove_sparse_layers:
+        v.bigbrain3d_purge_enabled = True
+        gui.log_warning("BIGBRAIN3D Will only work with installed hardware on a Prusa Printer")
+    else:
+        gui.log_warning("BIGBRAIN3D mode not compatible with sparse wipe tower in PS")
 
-    if keyword == "BIGBRAIN3D_ENABLE":
-        if not v.wipe_remove_sparse_layers:
-            v.bigbrain3d_purge_enabled = True
-            gui.log_warning("BIGBRAIN3D Will only work with installed hardware on a Prusa Printer")
-        else:
-            gui.log_warning("BIGBRAIN3D mode not compatible with sparse wipe tower in PS")
-        return
 
-    if keyword == "BIGBRAIN3D_SMARTFAN":
-        v.bigbrain3d_smartfan = True
-        return
+def set_linear_ping_length(value):
+    v.ping_interval = value
+    v.ping_length_multiplier = 1.0
 
-    if keyword == "MINSPLICE":
-        v.min_splice_length = floatparameter(value)
-        if v.min_splice_length < 70:
-            v.min_splice_length = 70
-            gui.log_warning("Minimal slice length adjusted to 70mm")
-        return
 
-    # LINEAR PING removed
+def set_ping_window(value):
+    # the window adds to the distance between pings, keep it well below the minimal ping distance
+    if value > MAX_PING_WINDOW:
+        gui.log_warning("Maximal ping window is {}mm!  Your config stated: {}".format(MAX_PING_WINDOW, value))
+        value = MAX_PING_WINDOW
+    v.ping_window = max(0, value)
+    gui.create_logitem("Pings are placed at retractions/travel moves within {:-6.2f}mm".format(v.ping_window))
 
-    if keyword == "LINEARPINGLENGTH":
-        v.ping_interval = floatparameter(value)
-        v.ping_length_multiplier = 1.0
-        if v.ping_interval < 300:
-            v.ping_interval = 300
-            gui.log_warning("Minimal Linear Ping distance is 300mm!  Your config stated: {}".format(line))
-        gui.create_logitem("Linear Ping interval of  {:-6.2f}mm".format(v.ping_interval))
-        return
 
-    # SIDE TRANSITIONING
-    if keyword == "SIDEWIPELOC":
-        v.side_wipe_loc = value
-        return
+def set_purge_top_speed(value):
+    v.purgetopspeed = int(value)
+    gui.create_logitem("Purge Max speed set to {:.0f}mm/min ({}mm/s)".format(v.purgetopspeed, v.purgetopspeed / 60))
 
-    if keyword == "PURGETOPSPEED":
-        v.purgetopspeed = int(floatparameter(value))
-        gui.create_logitem("Purge Max speed set to {:.0f}mm/min ({}mm/s)".format(v.purgetopspeed, v.purgetopspeed / 60))
-        return
 
-    if keyword == "WIPEFEEDRATE":
-        v.wipe_feedrate = floatparameter(value)
-        return
+def set_sidewipe_correction(value):
+    v.sidewipe_correction = value
+    if v.sidewipe_correction < 0.9 or v.sidewipe_correction > 1.10:
+        v.sidewipe_correction = 1.0
 
-    if keyword == "SIDEWIPEMINY":
-        v.sidewipe_miny = floatparameter(value)
-        return
 
-    if keyword == "SIDEWIPEMAXY":
-        v.sidewipe_maxy = floatparameter(value)
-        return
+def set_purge_tower_delta(value):
+    parm = abs(value)
+    if parm > 0.001 and v.wipe_remove_sparse_layers:
+        gui.log_warning("TOWER DELTA feature mode not compatible with sparse wipe tower in PS")
+        v.max_tower_delta = 0.0
+    else:
+        if parm != float(0):
+            v.max_tower_z_delta = parm
+            gui.create_logitem("Max Purge Tower Delta set to {:-2.2f}mm".format(v.max_tower_z_delta))
 
-    if keyword == "SIDEWIPECORRECTION":
-        v.sidewipe_correction = floatparameter(value)
-        if v.sidewipe_correction < 0.9 or v.sidewipe_correction > 1.10:
-            v.sidewipe_correction = 1.0
-        return
 
-    if keyword == "PURGETOWERDELTA":
-        parm = abs(floatparameter(value))
-        if parm > 0.001 and v.wipe_remove_sparse_layers:
-            gui.log_warning("TOWER DELTA feature mode not compatible with sparse wipe tower in PS")
-            v.max_tower_delta = 0.0
-        else:
-            if parm != float(0):
-                v.max_tower_z_delta = abs(floatparameter(value))
-                gui.create_logitem("Max Purge Tower Delta set to {:-2.2f}mm".format(v.max_tower_z_delta))
+def enable_full_purge_reduction(value):
+    if not v.wipe_remove_sparse_layers:
+        gui.create_logitem("Full purge reduction configured")
+        v.full_purge_reduction = True
+    else:
+        gui.log_warning("FULL PURGE TOWER REDUCTION feature mode not compatible with sparse wipe tower in PS")
+        v.full_purge_reduction = False
 
 
+def check_version(value):
+    # never wait for the network here, only report what is cached and refresh the cache in the background
+    if v.headless:
         return
-
-    if keyword == "FULLPURGEREDUCTION":
-        if not v.wipe_remove_sparse_layers:
-            gui.create_logitem("Full purge reduction configured")
-            v.full_purge_reduction = True
-        else:
-            gui.log_warning("FULL PURGE TOWER REDUCTION feature mode not compatible with sparse wipe tower in PS")
-            v.full_purge_reduction = False
+    import p2pp.checkversion as cv
+    import version
+    latest, latest_dev = cv.get_versions()
+    if latest is None or latest_dev is None:
         return
+    if latest > version.Version:
+        gui.create_logitem("New development version of P2PP available ({})".format(latest), "red", False, "2.0")
+    else:
+        if (latest < version.Version):
+            latest = latest_dev
+            if (latest > version.Version):
+                gui.create_logitem("New development version of P2PP available ({})".format(latest), "red", False,
+                                   "2.0")
+
+
+def disable_gui(value):
+    v.gui = False
+
+
+def enable_debug_tcommand(value):
+    v.debug_leaveToolCommands = True
+    gui.log_warning("DEBUGTCOMMAND ACTIVE - File will not print correctly!!")
+
+
+PARAMETERS = {}
+
+for parameter in [
+    Parameter("PRINTERPROFILE", textparameter, "printer_profile_string", hook=set_printer_profile),
+    Parameter("ACCESSORYMODE_MAF", flagparameter, "accessory_mode", hook=set_accessory_mode_maf),
+    Parameter("ACCESSORYMODE_MSF", flagparameter, "palette_plus", hook=set_accessory_mode_msf),
+    Parameter("P+LOADINGOFFSET", intparameter, "palette_plus_loading_offset"),
+    Parameter("P+PPM", intparameter, "palette_plus_ppm"),
+    Parameter("SPLICEOFFSET", floatparameter, "splice_offset", message="Splice Offset set to {:-5.2f}mm"),
+    Parameter("PROFILETYPEOVERRIDE", textparameter, "filament_type", hook=set_profile_type_override),
+    Parameter("EXTRUSIONMULTIPLIERCORRECTION", floatparameter, "extrusion_multiplier_correction"),
+    Parameter("EXTRAENDFILAMENT", floatparameter, "extra_runout_filament",
+              message="Extra filament at end of print {:-8.2f}mm"),
+    Parameter("BEFORESIDEWIPEGCODE", textparameter, "before_sidewipe_gcode", hook=add_before_sidewipe_gcode),
+    Parameter("AFTERSIDEWIPEGCODE", textparameter, "after_sidewipe_gcode", hook=add_after_sidewipe_gcode),
+    Parameter("AUTOADDPURGE", flagparameter, "autoaddsplice"),
+    Parameter("MINSTARTSPLICE", floatparameter, "min_start_splice_length", minimum=100,
+              warning="Minimal first slice length adjusted to 100mm"),
+    Parameter("BEDSIZEX", floatparameter, "bed_size_x"),
+    Parameter("BEDSIZEY", floatparameter, "bed_size_y"),
+    Parameter("BEDORIGINX", floatparameter, "bed_origin_x"),
+    Parameter("BEDORIGINY", floatparameter, "bed_origin_y"),
+    Parameter("BIGBRAIN3D_BLOBSIZE", intparameter, "bigbrain3d_blob_size"),
+    Parameter("BIGBRAIN3D_COOLINGTIME", intparameter, "bigbrain3d_blob_cooling_time"),
+    Parameter("BIGBRAIN3D_PURGEPOSITION", floatparameter, "bigbrain3d_x_position"),
+    Parameter("BIGBRAIN3D_MOTORPOWER_HIGH", intparameter, "bigbrain3d_motorpower_high"),
+    Parameter("BIGBRAIN3D_MOTORPOWER_NORMAL", intparameter, "bigbrain3d_motorpower_normal"),
+    Parameter("BIGBRAIN3D_NUMBER_OF_WHACKS", intparameter, "bigbrain3d_whacks"),
+    Parameter("BIGBRAIN3D_PRIME_BLOBS", intparameter, "bigbrain3d_prime"),
+    Parameter("BIGBRAIN3D_ENABLE", flagparameter, "bigbrain3d_purge_enabled", hook=enable_bigbrain3d),
+    Parameter("BIGBRAIN3D_SMARTFAN", flagparameter, "bigbrain3d_smartfan"),
+    Parameter("MINSPLICE", floatparameter, "min_splice_length", minimum=70,
+              warning="Minimal slice length adjusted to 70mm"),
+    Parameter("LINEARPINGLENGTH", floatparameter, "ping_interval", minimum=300,
+              warning="Minimal Linear Ping distance is 300mm!  Your config stated: {}",
+              message="Linear Ping interval of  {:-6.2f}mm", hook=set_linear_ping_length),
+    Parameter("PINGWINDOW", floatparameter, "ping_window", hook=set_ping_window),
 
-    if keyword == "CHECKVERSION":
-        import p2pp.checkversion as cv
-        import version
-        latest = cv.get_version(cv.MASTER)
-        if latest > version.Version:
-            gui.create_logitem("New development version of P2PP available ({})".format(latest), "red", False, "2.0")
-        else:
-            if (latest < version.Version):
-                latest = cv.get_version(cv.DEV)
-                if (latest > version.Version):
-                    gui.create_logitem("New development version of P2PP available ({})".format(latest), "red", False,
-                                       "2.0")
+    # SIDE TRANSITIONING
+    Parameter("SIDEWIPELOC", textparameter, "side_wipe_loc"),
+    Parameter("PURGETOPSPEED", floatparameter, "purgetopspeed", hook=set_purge_top_speed),
+    Parameter("WIPEFEEDRATE", floatparameter, "wipe_feedrate"),
+    Parameter("SIDEWIPEMINY", floatparameter, "sidewipe_miny"),
+    Parameter("SIDEWIPEMAXY", floatparameter, "sidewipe_maxy"),
+    Parameter("SIDEWIPECORRECTION", floatparameter, "sidewipe_correction", hook=set_sidewipe_correction),
+    Parameter("PURGETOWERDELTA", floatparameter, "max_tower_z_delta", hook=set_purge_tower_delta),
+    Parameter("FULLPURGEREDUCTION", flagparameter, "full_purge_reduction", hook=enable_full_purge_reduction),
+    Parameter("PURGEARCS", flagparameter, "purge_arcs", message="Purge tower turns generated as arcs"),
+    Parameter("CHECKVERSION", flagparameter, hook=check_version),
 
     # Program parameters
-    if keyword == "NOGUI":
-        v.gui = False
-        return
+    Parameter("NOGUI", flagparameter, "gui", hook=disable_gui),
+    Parameter("CONSOLEWAIT", flagparameter, "consolewait"),
+    Parameter("SYNCOUTPUT", flagparameter, "sync_output"),
+    Parameter("COMPACTOUTPUT", intparameter, "compact_output"),
+    Parameter("IGNOREWARNINGS", flagparameter, "ignore_warnings"),
+    Parameter("ABSOLUTEEXTRUDER", flagparameter, "absolute_extruder",
+              message="Convert to absolute extrusion parameters"),
+    Parameter("DEBUGTCOMMAND", flagparameter, "debug_leaveToolCommands", hook=enable_debug_tcommand),
+]:
+    PARAMETERS[parameter.name] = parameter
 
-    if keyword == "CONSOLEWAIT":
-        v.consolewait = True
-        return
 
-    if keyword == "IGNOREWARNINGS":
-        v.ignore_warnings = True
+def check_config_parameters(keyword, value):
+    parameter = PARAMETERS.get(keyword.upper())
+    if parameter is None:
         return
+    if value is None:
+        value = ""
+    parameter.apply(value)
 
-    if keyword == "ABSOLUTEEXTRUDER":
-        v.absolute_extruder = True
-        gui.create_logitem("Convert to absolute extrusion parameters")
-        return
 
-    if keyword == "DEBUGTCOMMAND":
-        v.debug_leaveToolCommands = True
-        gui.log_warning("DEBUGTCOMMAND ACTIVE - File will not print correctly!!")
-        return
+def parameter_list():
+    return [PARAMETERS[name] for name in sorted(PARAMETERS)]
+
+
+def effective_values():
+    # current value of every parameter that is stored in a variable
+    values = {}
+    for parameter in parameter_list():
+        if parameter.target:
+            values[parameter.name] = parameter.value()
+    return values
+
+
+def config_fingerprint():
+    # identifies the effective configuration, e.g. as part of a cache key
+    return hashlib.sha1(repr(sorted(effective_values().items())).encode('utf-8')).hexdigest()
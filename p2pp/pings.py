@@ -7,6 +7,8 @@ __license__ = 'GPLv3'
 __maintainer__ = 'Tom Van den Eede'
 __email__ = 'P2PP@pandora.be'
 
+import re
+
 import p2pp.gcode as gcode
 import p2pp.variables as v
 from p2pp.formatnumbers import hexify_float
@@ -14,70 +16,130 @@ from p2pp.formatnumbers import hexify_float
 acc_first_pause = ";PING PAUSE 1 START\nG4 P4000\nG1\nG4 P4000\nG1\nG4 P4000\nG1\nG4 P1000\nG1\n;PING PAUSE 1 END\n"
 acc_second_pause = ";PING PAUSE 2 START\nG4 P4000\nG1\nG4 P3000\nG1\n;PING PAUSE 2 END\n"
 
+# accessory mode: extrusion (mm) between the two pauses of a ping, the overshoot that is accepted before the move
+# that passes the ping length is split, and the delay (fraction of the ping interval) accepted to find a purge block
+# long enough for the ping
+ACC_PING_LENGTH = 20
+ACC_PING_OVERSHOOT = 5
+ACC_PING_MAX_DELAY = 0.5
+
+PING_START = gcode.GCodeTemplate(
+    "; --- P2PP - Added Sequence - INITIATE PING -  START COMMAND after {:-10.4f}mm of extrusion \n")
+PING_PAUSE = gcode.GCodeTemplate("G4 S0 \n")
+PING = gcode.GCodeTemplate("O31 {}\n")
+PING_END = gcode.GCodeTemplate("; --- P2PP - Added Sequence - INITIATE PING  -  END\n")
+
 
 def check_first_ping_condition():
     return (v.total_material_extruded - v.last_ping_extruder_position) > v.ping_interval
 
 
-def check_connected_ping():
+def pause_point(g):
+    # commands where the printer comes to a stop anyway: retractions and travel moves
+    if g.is_retract_command():
+        return True
+    return g.is_movement_command() and (g.has_X() or g.has_Y() or g.has_Z()) and not g.E
+
+
+def check_connected_ping(at_pause_point=False):
     if not v.accessory_mode and check_first_ping_condition():
+        # with a ping window the ping waits for the next pause point, unless the window has passed
+        if v.ping_window > 0 and not at_pause_point:
+            if v.total_material_extruded - v.last_ping_extruder_position - v.ping_interval < v.ping_window:
+                return
         v.ping_interval = v.ping_interval * v.ping_length_multiplier
         v.ping_interval = min(v.max_ping_interval, v.ping_interval)
         v.last_ping_extruder_position = v.total_material_extruded
         v.ping_extruder_position.append(v.last_ping_extruder_position)
 
-        gcode.issue_code(
-            "; --- P2PP - Added Sequence - INITIATE PING -  START COMMAND after {:-10.4f}mm of extrusion \n".format(
-                v.last_ping_extruder_position))
-        gcode.issue_code("G4 S0 \n")
-        gcode.issue_code("O31 {}\n".format(hexify_float(v.last_ping_extruder_position)))
-        gcode.issue_code("; --- P2PP - Added Sequence - INITIATE PING  -  END\n")
+        PING_START.issue(v.last_ping_extruder_position)
+        PING_PAUSE.issue()
+        PING.issue(hexify_float(v.last_ping_extruder_position))
+        PING_END.issue()
+
+
+def pause_time(sequence):
+    # dwell time (s) of a pause sequence
+    return sum(int(ms) for ms in re.findall(r"G4 P(\d+)", sequence)) / 1000.0
+
+
+def purge_block_extrusion(index):
+    # extrusion of the purge block that starts at index
+    block = v.parsed_gcode[index].Class
+    extrusion = 0.0
+    while index < len(v.parsed_gcode) and v.parsed_gcode[index].Class == block:
+        g = v.parsed_gcode[index]
+        if g.is_movement_command() and g.E and g.E > 0:
+            extrusion += g.E
+        index += 1
+    return extrusion * v.extrusion_multiplier * v.extrusion_multiplier_correction
 
 
-def check_accessorymode_first():
+def check_accessorymode_first(index):
+    # the ping extrusion is best done in a purge block, where the pauses don't show on the print.  Purge blocks that
+    # are too short are skipped, unless the ping is already overdue for half the ping interval
     if v.accessory_mode and check_first_ping_condition():
-        v.acc_ping_left = 20
+        overdue = v.total_material_extruded - v.last_ping_extruder_position - v.ping_interval
+        if purge_block_extrusion(index) < ACC_PING_LENGTH and overdue < ACC_PING_MAX_DELAY * v.ping_interval:
+            return
+        v.acc_ping_start = v.total_material_extruded
+        v.acc_ping_left = ACC_PING_LENGTH
+        v.acc_ping_dwell_time += pause_time(acc_first_pause)
         gcode.issue_code("; ------------------------------------\n")
         gcode.issue_code("; --- P2PP - ACCESSORY MODE PING PART 1\n")
         gcode.issue_code(acc_first_pause)
         gcode.issue_code("; -------------------------------------\n")
 
 
-def interpollate(_from, _to, _part):
-    if _part == 0:
-        return _from
-    else:
-        return _from + (_to - _from) / _part
-
-
-def check_accessorymode_second(e):
-    nextline = None
-    if v.accessory_mode and (v.acc_ping_left > 0):
-
-        if v.acc_ping_left >= e:
-            v.acc_ping_left -= e
-        else:
-
-            proc = v.acc_ping_left / e
-            int_x = interpollate(v.previous_position_x, v.current_position_x, proc)
-            int_y = interpollate(v.previous_position_y, v.current_position_y, proc)
-            to_z = v.current_position_z
-            gcode.issue_code("G1 X{:.4f} Y{:.4f} Z{:.4f} E{:.4f}\n".format(int_x, int_y, to_z, v.acc_ping_left))
-            e -= v.acc_ping_left
-            v.acc_ping_left = 0
-            nextline = "G1 X{:.4f} Y{:.4f} E{:.4f}\n".format(v.current_position_x, v.current_position_y, e)
-
-        if v.acc_ping_left <= 0.1:
-            gcode.issue_code("; -------------------------------------\n")
-            gcode.issue_code("; --- P2PP - ACCESSORY MODE PING PART 2\n")
-            gcode.issue_code(acc_second_pause)
-            gcode.issue_code("; -------------------------------------\n")
-            v.ping_interval = v.ping_interval * v.ping_length_multiplier
-            v.ping_interval = min(v.max_ping_interval, v.ping_interval)
-            v.last_ping_extruder_position = v.total_material_extruded
-            v.ping_extruder_position.append(v.total_material_extruded - 20 + v.acc_ping_left)
-            v.ping_extrusion_between_pause.append(20 - v.acc_ping_left)
-            v.acc_ping_left = 0
-
-            if nextline:
-                gcode.issue_code(nextline)
+def interpolate(_from, _to, _part):
+    return _from + (_to - _from) * _part
+
+
+def split_move(g, extrusion):
+    # g, the last command issued, is cut at extrusion (accounted mm) from the start of the move, the rest of the
+    # move is returned as a separate line.  The extrusion of g is already accounted for in full
+    part = extrusion / (g.E * v.extrusion_multiplier * v.extrusion_multiplier_correction)
+    rest = "G1"
+    if g.has_X():
+        rest += " X{:.3f}".format(g.X)
+        g.update_parameter("X", interpolate(v.previous_position_x, g.X, part))
+    if g.has_Y():
+        rest += " Y{:.3f}".format(g.Y)
+        g.update_parameter("Y", interpolate(v.previous_position_y, g.Y, part))
+    rest += " E{:.5f}\n".format(g.E * (1 - part))
+    g.update_parameter("E", g.E * part)
+    return rest
+
+
+def check_accessorymode_second(g):
+    if not v.accessory_mode or v.acc_ping_left <= 0:
+        return
+
+    extruded = v.total_material_extruded - v.acc_ping_start
+    v.acc_ping_left = ACC_PING_LENGTH - extruded
+    if v.acc_ping_left > 0.1:
+        return
+
+    # the real extrusion between the pauses is reported, a move is only split when it goes too far beyond the
+    # ping length
+    rest = None
+    if -v.acc_ping_left > ACC_PING_OVERSHOOT and g.is_movement_command() and g.E > 0 and \
+            g is gcode.pending_commands[-1]:
+        rest = split_move(g, g.E * v.extrusion_multiplier * v.extrusion_multiplier_correction + v.acc_ping_left)
+        extruded = ACC_PING_LENGTH
+
+    gcode.issue_code("; -------------------------------------\n")
+    gcode.issue_code("; --- P2PP - ACCESSORY MODE PING PART 2\n")
+    gcode.issue_code(acc_second_pause)
+    gcode.issue_code("; -------------------------------------\n")
+    if rest:
+        # already accounted for with g
+        gcode.issue(rest)
+
+    v.acc_ping_dwell_time += pause_time(acc_second_pause)
+    v.ping_interval = v.ping_interval * v.ping_length_multiplier
+    v.ping_interval = min(v.max_ping_interval, v.ping_interval)
+    v.last_ping_extruder_position = v.total_material_extruded
+    v.ping_extruder_position.append(v.acc_ping_start)
+    v.ping_extrusion_between_pause.append(extruded)
+    v.acc_ping_left = 0
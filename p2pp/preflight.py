@@ -0,0 +1,146 @@
+__author__ = 'Tom Van den Eede'
+__copyright__ = 'Copyright 2018-2020, Palette2 Splicer Post Processing Project'
+__credits__ = ['Tom Van den Eede',
+               'Tim Brookman'
+               ]
+__license__ = 'GPLv3'
+__maintainer__ = 'Tom Van den Eede'
+__email__ = 'P2PP@pandora.be'
+
+# Pre-flight scan.  Looks at the line prefixes only (no GCode parsing, no output) to estimate what processing the
+# file will involve and to catch files that can't be processed before spending minutes on them.
+
+import json
+import sys
+
+import p2pp.bgcode as bgcode
+import p2pp.mcf as mcf
+import p2pp.parameters as parameters
+import p2pp.variables as v
+from p2pp.gcodeparser import parse_slic3r_config
+
+# rough figures for a full run, measured on a desktop machine
+PROCESS_LINES_PER_SECOND = 50000
+MEMORY_BYTES_PER_LINE = 700
+
+
+def extrusion(line):
+    pos = line.find(" E")
+    if pos == -1:
+        return 0.0
+    end = line.find(" ", pos + 2)
+    if end == -1:
+        end = len(line)
+    try:
+        return float(line[pos + 2:end])
+    except ValueError:
+        return 0.0
+
+
+def scan(input_file):
+    lines = mcf.read_gcode_lines(input_file)
+
+    layers = 0
+    layer_heights = 0
+    tool_commands = 0
+    segments = []
+    segment = 0.0
+    tool = None
+    config = []
+
+    for line in lines:
+        first = line[:1]
+        if first == ";":
+            if line.startswith(";LAYER"):
+                if line.startswith(";LAYERHEIGHT"):
+                    layer_heights += 1
+                elif line.startswith(";LAYER "):
+                    layers += 1
+            elif line.startswith(";P2PP"):
+                m = v.regex_p2pp.match(line)
+                if m:
+                    parameters.check_config_parameters(m.group(1), m.group(2))
+            elif line.startswith("; "):
+                config.append(line)
+        elif first == "G":
+            if line.startswith("G1 ") or line.startswith("G0 "):
+                e = extrusion(line)
+                if e > 0:
+                    segment += e
+        elif first == "T":
+            try:
+                new_tool = int(line[1:].split(";")[0])
+            except ValueError:
+                continue
+            tool_commands += 1
+            if tool is not None and new_tool != tool:
+                segments.append(segment)
+                segment = 0.0
+            tool = new_tool
+    segments.append(segment)
+
+    if v.bgcode_input:
+        config = bgcode.config_lines(v.bgcode_input)
+    parse_slic3r_config(config)
+
+    side_wipe = not mcf.coordinate_on_bed(v.wipetower_posx, v.wipetower_posy)
+    if v.accessory_mode:
+        mode = "accessory"
+    elif side_wipe:
+        mode = "side wipe"
+    elif v.full_purge_reduction:
+        mode = "full purge reduction"
+    elif v.max_tower_z_delta > 0:
+        mode = "tower delta"
+    else:
+        mode = "tower"
+
+    # the splices are estimated from the extrusion between tool changes, without purge and splice offset
+    short_splices = 0
+    for idx in range(len(segments)):
+        minimum = v.min_start_splice_length if idx == 0 else v.min_splice_length
+        if segments[idx] < minimum:
+            short_splices += 1
+
+    errors = []
+    warnings = []
+    if v.synced_support or not v.prints_support:
+        if layers == 0:
+            errors.append("No ;LAYER lines, add ;LAYER [layer_num] to the before layer change GCode")
+    elif layer_heights == 0:
+        errors.append("No ;LAYERHEIGHT lines, add ;LAYERHEIGHT [layer_z] to the before layer change GCode")
+    if len(segments) < 2:
+        warnings.append("This does not look like a multi-colour file")
+    if not v.accessory_mode and v.printer_profile_string == "":
+        warnings.append("The PRINTERPROFILE identifier is missing")
+    if side_wipe and v.side_wipe_loc == "" and not v.bigbrain3d_purge_enabled:
+        warnings.append("Using sidewipe with undefined SIDEWIPELOC")
+
+    return {"input_file": input_file,
+            "lines": len(lines),
+            "layers": layers,
+            "layer_heights": layer_heights,
+            "tool_commands": tool_commands,
+            "tool_changes": len(segments) - 1,
+            "mode": mode,
+            "estimated_splices": len(segments),
+            "short_splice_risk": short_splices,
+            "shortest_splice": min(segments),
+            "estimated_seconds": round(float(len(lines)) / PROCESS_LINES_PER_SECOND, 1),
+            "estimated_memory_mb": round(float(len(lines)) * MEMORY_BYTES_PER_LINE / 1000000, 1),
+            "errors": errors,
+            "warnings": warnings}
+
+
+def preflight(input_file):
+    # writes the scan result as JSON to stdout, returns the exit code
+    try:
+        result = scan(input_file)
+    except (IOError, EOFError) as e:
+        result = {"input_file": input_file, "errors": ["Could not read input file: {}".format(e)]}
+
+    json.dump(result, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write("\n")
+    if result["errors"]:
+        return 1
+    return 0
@@ -7,13 +7,15 @@ __license__ = 'GPLv3'
 __maintainer__ = 'Tom Van den Eede'
 __email__ = 'P2PP@pandora.be'
 
+import bisect
+import math
+
 import p2pp.gcode as gcode
 import p2pp.gcodeparser as gcodeparser
 import p2pp.variables as v
 
 solidlayer = []
 emptylayer = []
-filllayer = []
 brimlayer = []
 
 PURGE_SOLID = 1
@@ -26,12 +28,22 @@ sequence_length_solid = 0
 sequence_length_empty = 0
 sequence_length_brim = 0
 
+RETRACT = gcode.GCodeTemplate("G1 E-{:.2f}\n")
+RETRACT_SPEED = gcode.GCodeTemplate("G1 E-{:.2f} F{:.0f}\n")
+UNRETRACT = gcode.GCodeTemplate("G1 E{:.2f}\n")
+UNRETRACT_SPEED = gcode.GCodeTemplate("G1 E{:.2f} F{:.0f}\n")
+FIRMWARE_RETRACT = gcode.GCodeTemplate("G10\n")
+FIRMWARE_UNRETRACT = gcode.GCodeTemplate("G11\n")
+
 last_posx = None
 last_posy = None
 
 last_brim_x = None
 last_brim_y = None
 
+# purge sequences rendered to text, keyed on (purge form, speed)
+rendered_sequences = {}
+
 
 def if_defined(x, y):
     if x:
@@ -85,6 +97,8 @@ def _purge_calculate_sequences_length():
 
 
 def _purge_create_sequence(code, pformat, x, y, w, h, step1):
+    # zig-zag over the purge area: strokes along the second axis, joined by turns of step1 along the first axis.
+    # pformat writes the first and second axis coordinates (X Y or Y X)
     generate_front = False
 
     ew = v.extrusion_width
@@ -100,28 +114,87 @@ def _purge_create_sequence(code, pformat, x, y, w, h, step1):
     code.append(gcode.GCodeCommand(pformat.format(start1, start2)))
     pformat = (pformat + " E{:.4f}")
 
+    # (turn, first axis, second axis, extrusion)
+    moves = []
     while start1 < end1:
         if generate_front:
-            code.append(gcode.GCodeCommand(pformat.format(start1, start2, calculate_purge(step1))))
+            moves.append((True, start1, start2, calculate_purge(step1)))
         else:
             generate_front = True
 
-        code.append(gcode.GCodeCommand(pformat.format(start1, end2, calculate_purge(end2 - start2))))
+        moves.append((False, start1, end2, calculate_purge(end2 - start2)))
         start1 += step1
 
         if start1 < end1:
-            code.append(gcode.GCodeCommand(pformat.format(start1, end2, calculate_purge(step1))))
-            code.append(gcode.GCodeCommand(pformat.format(start1, start2, calculate_purge(end2 - start2))))
+            moves.append((True, start1, end2, calculate_purge(step1)))
+            moves.append((False, start1, start2, calculate_purge(end2 - start2)))
         start1 += step1
 
+    if v.purge_arcs and end2 - start2 > step1:
+        _purge_round_turns(code, pformat, moves, step1, start2, end2, pformat.startswith("G1 Y"))
+        return
+
+    for turn, pos1, pos2, e in moves:
+        code.append(gcode.GCodeCommand(pformat.format(pos1, pos2, e)))
+
+
+def _purge_round_turns(code, pformat, moves, step1, start2, end2, swapped):
+    # every turn becomes a half circle with diameter step1 within the purge area, the strokes next to it are
+    # shortened by the radius.  The extrusion of every move follows the length of the path it draws, scaled so the
+    # layer purges as much as the straight line layer
+    r = step1 / 2
+    lengths = [math.pi * r if turn else end2 - start2 for turn, pos1, pos2, e in moves]
+    for idx in range(len(moves)):
+        turn, pos1, pos2, e = moves[idx]
+        if turn:
+            # the turn is at the end of the second axis that the previous stroke went to
+            inward = -r if pos2 == end2 else r
+            prev_turn, prev1, prev2, prev_e = moves[idx - 1]
+            moves[idx - 1] = (prev_turn, prev1, prev2 + inward, prev_e)
+            moves[idx] = (turn, pos1, pos2 + inward, e)
+            lengths[idx - 1] -= r
+            if idx + 1 < len(moves):
+                lengths[idx + 1] -= r
+
+    # the extrusion is spread over the moves in 0.0001mm steps, the rounded total matches the straight line layer
+    straight = sum(round(e, 4) for turn, pos1, pos2, e in moves)
+    purge = [calculate_purge(length) for length in lengths]
+    scale = straight / sum(purge)
+    total = 0.0
+    done = 0.0
+    for idx in range(len(moves)):
+        turn, pos1, pos2, e = moves[idx]
+        total += purge[idx] * scale
+        e = round(total, 4) - done
+        done = round(total, 4)
+        moves[idx] = (turn, pos1, pos2, e)
+
+    for idx in range(len(moves)):
+        turn, pos1, pos2, e = moves[idx]
+        if not turn:
+            code.append(gcode.GCodeCommand(pformat.format(pos1, pos2, e)))
+            continue
+
+        # the center is halfway the turn, the arc bulges outward (towards the end of the second axis)
+        bulge = r if pos2 > (start2 + end2) / 2 else -r
+        if swapped:
+            x, y, offset = pos2, pos1, "J{:.3f}".format(r)
+            # (start - center) = (0, -r), (bulge - center) = (bulge, 0)
+            counterclockwise = r * bulge > 0
+        else:
+            x, y, offset = pos1, pos2, "I{:.3f}".format(r)
+            # (start - center) = (-r, 0), (bulge - center) = (0, bulge)
+            counterclockwise = -r * bulge > 0
+        code.append(gcode.GCodeCommand("G{} X{:.3f} Y{:.3f} {} E{:.4f} F%SPEED%".format(
+            3 if counterclockwise else 2, x, y, offset, e)))
 
 
 def purge_create_layers(x, y, w, h):
-    global solidlayer, emptylayer, filllayer
+    global solidlayer, emptylayer, rendered_sequences
 
     solidlayer = []
     emptylayer = []
-    filllayer = []
+    rendered_sequences = {}
 
     ew = v.extrusion_width
 
@@ -134,12 +207,8 @@ def purge_create_layers(x, y, w, h):
     emptylayer.append(gcode.GCodeCommand(";---- EMPTY WIPE -------"))
     generate_rectangle(emptylayer, x, y, w, h)
 
-    filllayer.append(gcode.GCodeCommand(";---- FILL LAYER -------"))
-    generate_rectangle(filllayer, x, y, w, h)
-
     _purge_create_sequence(solidlayer, "G1 X{:.3f} Y{:.3f} F%SPEED%", x, y, w, h, ew)
     _purge_create_sequence(emptylayer, "G1 Y{:.3f} X{:.3f} F%SPEED%", y, x, h, w, 2)
-    _purge_create_sequence(filllayer, "G1 Y{:.3f} X{:.3f} F%SPEED%", y, x, h, w, 15)
 
     _purge_generate_tower_brim(x, y, w, h)
 
@@ -169,11 +238,35 @@ def _purge_update_sequence_index():
         if v.side_wipe_length > 0:
             gcode.issue_code("G1 Z{:.2f} F10800\n".format((v.purgelayer + 1) * v.layer_height))
 
-def _purge_get_nextcommand_in_sequence():
+def _purge_get_rendered_sequence(speed):
+    # the sequence for the current purge form as output lines for the given speed, together with
+    # the cumulative extrusion and the last known X/Y position after each line
+    key = (current_purge_form, speed)
+    if key in rendered_sequences:
+        return rendered_sequences[key]
+
     if current_purge_form == PURGE_SOLID:
-        return solidlayer[current_purge_index]
+        layer = solidlayer
     else:
-        return emptylayer[current_purge_index]
+        layer = emptylayer
+
+    speed = "{:0.0f}".format(speed)
+    lines = []
+    extrusion = []
+    positions = []
+    total = 0
+    posx = None
+    posy = None
+    for command in layer:
+        lines.append(str(command).replace("%SPEED%", speed))
+        total += if_defined(command.E, 0)
+        extrusion.append(total)
+        posx = if_defined(command.X, posx)
+        posy = if_defined(command.Y, posy)
+        positions.append((posx, posy))
+
+    rendered_sequences[key] = (lines, extrusion, positions)
+    return rendered_sequences[key]
 
 
 def _purge_generate_tower_brim(x, y, w, h):
@@ -205,21 +298,21 @@ def retract(tool, speed=-1):
     if not v.use_firmware_retraction:
         length = v.retract_length[tool]
         if speed > 0:
-            gcode.issue_code("G1 E-{:.2f} F{:.0f}\n".format(v.retract_length[tool], speed))
+            RETRACT_SPEED.issue(v.retract_length[tool], speed)
         else:
-            gcode.issue_code("G1 E-{:.2f}\n".format(v.retract_length[tool]))
+            RETRACT.issue(v.retract_length[tool])
         v.retraction -= length
     else:
-        gcode.issue_code("G10\n")
+        FIRMWARE_RETRACT.issue()
         v.retraction -= 1
 
 
 def largeretract():
     if not v.use_firmware_retraction:
-        gcode.issue_code("G1 E-{:.2f}\n".format(3))
+        RETRACT.issue(3)
         v.retraction -= 3
     else:
-        gcode.issue_code("G10\n")
+        FIRMWARE_RETRACT.issue()
         v.retraction -= 1
 
 def unretract(tool, speed=-1):
@@ -228,11 +321,11 @@ def unretract(tool, speed=-1):
     if not v.use_firmware_retraction:
         length = max(-v.retraction, v.retract_length[tool])
         if speed > 0:
-            gcode.issue_code("G1 E{:.2f} F{:.0f}\n".format(length, speed))
+            UNRETRACT_SPEED.issue(length, speed)
         else:
-            gcode.issue_code("G1 E{:.2f}\n".format(length))
+            UNRETRACT.issue(length)
     else:
-        gcode.issue_code("G11\n")
+        FIRMWARE_UNRETRACT.issue()
     v.retraction = 0
 
 
@@ -256,7 +349,7 @@ def purge_generate_brim():
     # correct the amount of extrusion for the brim
 
 def purge_generate_sequence():
-    global last_posx, last_posy
+    global last_posx, last_posy, current_purge_index
 
     if last_posx is None:
         last_posx = v.purge_sequence_x
@@ -295,13 +388,25 @@ def purge_generate_sequence():
     unretract(v.current_tool)
     # generate wipe code
     while v.side_wipe_length > 0:
-        next_command = _purge_get_nextcommand_in_sequence()
+        lines, extrusion, positions = _purge_get_rendered_sequence(getwipespeed())
 
-        last_posx = if_defined(next_command.X, last_posx)
-        last_posy = if_defined(next_command.Y, last_posy)
-        v.side_wipe_length -= if_defined(next_command.E, 0)
-        actual += if_defined(next_command.E, 0)
-        next_command.issue_command_speed(getwipespeed())
+        # copy up to and including the first line that completes the purge, or to the end of the layer
+        start = current_purge_index
+        if start > 0:
+            base = extrusion[start - 1]
+        else:
+            base = 0
+        end = min(bisect.bisect_left(extrusion, base + v.side_wipe_length, start) + 1, len(lines))
+
+        purged = extrusion[end - 1] - base
+        gcode.issue_lines(lines[start:end])
+        gcode.account_extrusion(purged)
+
+        last_posx = if_defined(positions[end - 1][0], last_posx)
+        last_posy = if_defined(positions[end - 1][1], last_posy)
+        v.side_wipe_length -= purged
+        actual += purged
+        current_purge_index = end - 1
         _purge_update_sequence_index()
 
     # return to print height
@@ -9,7 +9,31 @@ __email__ = 'P2PP@pandora.be'
 
 import p2pp.purgetower as purgetower
 import p2pp.variables as v
-from p2pp.gcode import issue_code
+from p2pp.gcode import issue_code, GCodeTemplate
+
+FAN_OFF = GCodeTemplate("M107                ; Turn FAN OFF\n")
+FAN_SPEED = GCodeTemplate("M106 S{}           ; Set FAN Power\n")
+BLOB_START = GCodeTemplate("\n;---- BIGBRAIN3D SIDEWIPE BLOB {} -- purge {:.3f}mm\n")
+BLOB_WAIT = GCodeTemplate("G4 P2000")
+BLOB_NEAR_EDGE = GCodeTemplate("G1 X{:.3f} F3000   ; go near the edge of the print\n")
+BLOB_POSITION = GCodeTemplate("G1 X{:.3f} F1000   ; go to the actual wiping position\n")
+BLOB_PURGE_FAN = [GCodeTemplate("G1 E{:6.3f} F200     ; Purge FAN OFF \n"),
+                  GCodeTemplate("G1 E{:6.3f} F200     ; Purge FAN 25% \n"),
+                  GCodeTemplate("G1 E{:6.3f} F200     ; Purge FAN 50% \n"),
+                  GCodeTemplate("G1 E{:6.3f} F200     ; Purge FAN 75% \n")]
+BLOB_PURGE = GCodeTemplate("G1 E{:6.3f} F200     ; UNRETRACT/PURGE/RETRACT \n")
+BLOB_COOLING = GCodeTemplate("G4 S{0:.0f}              ; blob {0}s cooling time\n")
+BLOB_FLICKER = GCodeTemplate("G1 X{:.3f} F10800  ; activate flicker\n")
+WHACK_PREP = GCodeTemplate("G4 S1               ; Mentally prep for second whack\n")
+WHACK_APPROACH = GCodeTemplate("G1 X{:.3f} F3000   ; approach for second whach\n")
+WHACK_POSITION = GCodeTemplate("G1 X{:.3f} F1000   ; final position for whack and......\n")
+WHACK = GCodeTemplate("G1 X{:.3f} F10800  ; WHACKAAAAA!!!!\n")
+
+SIDEWIPE_SEPARATOR = GCodeTemplate(";---------------------------\n")
+SIDEWIPE_START = GCodeTemplate(";  P2PP SIDE WIPE: {:7.3f}mm\n")
+SIDEWIPE_SPEED = GCodeTemplate("G1 F8640\n")
+SIDEWIPE_POSITION = GCodeTemplate("G0 {} Y{}\n")
+SIDEWIPE_SWEEP = GCodeTemplate("G1 {} Y{} E{:.5f} F{}\n")
 
 
 #
@@ -18,9 +42,9 @@ from p2pp.gcode import issue_code
 
 def setfanspeed(n):
     if n == 0:
-        issue_code("M107                ; Turn FAN OFF\n")
+        FAN_OFF.issue()
     else:
-        issue_code("M106 S{}           ; Set FAN Power\n".format(n))
+        FAN_SPEED.issue(n)
 
 
 def resetfanspeed():
@@ -28,40 +52,35 @@ def resetfanspeed():
 
 
 def generate_blob(length, count):
-    issue_code("\n;---- BIGBRAIN3D SIDEWIPE BLOB {} -- purge {:.3f}mm\n".format(count + 1, length))
+    BLOB_START.issue(count + 1, length)
     # issue_code("M907 X{} ; set motor power\n".format(int(v.purgemotorpower)))
     setfanspeed(0)
-    issue_code("G4 P2000")
-    issue_code(
-        "G1 X{:.3f} F3000   ; go near the edge of the print\n".format(v.bigbrain3d_x_position - 10))
-    issue_code(
-        "G1 X{:.3f} F1000   ; go to the actual wiping position\n".format(v.bigbrain3d_x_position))  # takes 2.5 seconds
+    BLOB_WAIT.issue()
+    BLOB_NEAR_EDGE.issue(v.bigbrain3d_x_position - 10)
+    BLOB_POSITION.issue(v.bigbrain3d_x_position)  # takes 2.5 seconds
 
     if v.retraction < 0:
         purgetower.unretract(v.current_tool, 1200)
     if v.bigbrain3d_smartfan:
-        issue_code("G1 E{:6.3f} F200     ; Purge FAN OFF \n".format(length / 4))
+        BLOB_PURGE_FAN[0].issue(length / 4)
         setfanspeed(64)
-        issue_code("G1 E{:6.3f} F200     ; Purge FAN 25% \n".format(length / 4))
+        BLOB_PURGE_FAN[1].issue(length / 4)
         setfanspeed(128)
-        issue_code("G1 E{:6.3f} F200     ; Purge FAN 50% \n".format(length / 4))
+        BLOB_PURGE_FAN[2].issue(length / 4)
         setfanspeed(192)
-        issue_code("G1 E{:6.3f} F200     ; Purge FAN 75% \n".format(length / 4))
+        BLOB_PURGE_FAN[3].issue(length / 4)
     else:
-        issue_code("G1 E{:6.3f} F200     ; UNRETRACT/PURGE/RETRACT \n".format(length))
+        BLOB_PURGE.issue(length)
     purgetower.largeretract()
     setfanspeed(255)
-    issue_code(
-        "G4 S{0:.0f}              ; blob {0}s cooling time\n".format(v.bigbrain3d_blob_cooling_time))
-    issue_code("G1 X{:.3f} F10800  ; activate flicker\n".format(v.bigbrain3d_x_position - 20))
+    BLOB_COOLING.issue(v.bigbrain3d_blob_cooling_time)
+    BLOB_FLICKER.issue(v.bigbrain3d_x_position - 20)
 
     for i in range(v.bigbrain3d_whacks):
-        issue_code(
-            "G4 S1               ; Mentally prep for second whack\n".format(v.bigbrain3d_x_position - 20))
-        issue_code("G1 X{:.3f} F3000   ; approach for second whach\n".format(v.bigbrain3d_x_position - 10))
-        issue_code("G1 X{:.3f} F1000   ; final position for whack and......\n".format(
-            v.bigbrain3d_x_position))  # takes 2.5 seconds
-        issue_code("G1 X{:.3f} F10800  ; WHACKAAAAA!!!!\n".format(v.bigbrain3d_x_position - 20))
+        WHACK_PREP.issue()
+        WHACK_APPROACH.issue(v.bigbrain3d_x_position - 10)
+        WHACK_POSITION.issue(v.bigbrain3d_x_position)  # takes 2.5 seconds
+        WHACK.issue(v.bigbrain3d_x_position - 20)
 
 
 
@@ -124,8 +143,8 @@ def create_side_wipe():
     if not v.side_wipe or v.side_wipe_length == 0:
         return
 
-    issue_code(";---------------------------\n")
-    issue_code(";  P2PP SIDE WIPE: {:7.3f}mm\n".format(v.side_wipe_length))
+    SIDEWIPE_SEPARATOR.issue()
+    SIDEWIPE_START.issue(v.side_wipe_length)
 
     for line in v.before_sidewipe_gcode:
         issue_code(line + "\n")
@@ -133,8 +152,8 @@ def create_side_wipe():
     if v.retraction == 0:
         purgetower.retract(v.current_tool)
 
-    issue_code("G1 F8640\n")
-    issue_code("G0 {} Y{}\n".format(v.side_wipe_loc, v.sidewipe_miny))
+    SIDEWIPE_SPEED.issue()
+    SIDEWIPE_POSITION.issue(v.side_wipe_loc, v.sidewipe_miny)
 
     sweep_base_speed = v.wipe_feedrate * 20 * abs(v.sidewipe_maxy - v.sidewipe_miny) / 150
     sweep_length = 20
@@ -150,8 +169,7 @@ def create_side_wipe():
         v.side_wipe_length -= sweep_length
         wipe_speed = min(5000, int(sweep_base_speed / sweep))
 
-        issue_code(
-            "G1 {} Y{} E{:.5f} F{}\n".format(v.side_wipe_loc, moveto, sweep * v.sidewipe_correction, wipe_speed))
+        SIDEWIPE_SWEEP.issue(v.side_wipe_loc, moveto, sweep * v.sidewipe_correction, wipe_speed)
 
         rangeidx += 1
         moveto = yrange[rangeidx % 2]
@@ -160,7 +178,7 @@ def create_side_wipe():
         issue_code(line + "\n")
 
     purgetower.retract(v.current_tool)
-    issue_code("G1 F8640\n")
-    issue_code(";---------------------------\n")
+    SIDEWIPE_SPEED.issue()
+    SIDEWIPE_SEPARATOR.issue()
 
     v.side_wipe_length = 0
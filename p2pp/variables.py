@@ -68,6 +68,11 @@ default_printerprofile = '50325050494e464f'
 
 input_gcode = []
 processed_gcode = []  # final output array with Gcode
+bgcode_input = None  # metadata, thumbnails of a binary gcode input file
+sync_output = False  # fsync output files before they replace the destination
+compact_output = 0  # compact output profile (p2pp.compact), 0 = off
+analyze = False  # --analyze: only collect the splice information and statistics, no GCode is rendered
+omega_result = None  # omega header, summary and warnings of an --analyze run
 
 # These variables are used to build the splice information table (Omega-30 commands in GCode) that drives the Palette2.
 # spliceoffset allows for a correction of the position at which the transition occurs.
@@ -78,6 +83,12 @@ splice_extruder_position = []
 splice_used_tool = []  # type: List[Any]
 splice_length = []
 
+# transition statistics per [from input][to input], updated as splices are added
+transition_count = [[0] * 4 for i in range(4)]
+transition_length = [[0.0] * 4 for i in range(4)]
+transition_min_length = [[0.0] * 4 for i in range(4)]
+transition_shortest_splice = [[-1] * 4 for i in range(4)]
+
 # SIDE WIPES
 side_wipe_loc = ""  # type: str
 side_wipe = False  # type: bool
@@ -136,11 +147,15 @@ hotswap_count = 0  # type: int
 # TotalExtrusion keeps track of the total extrusion in mm for the print taking into account the Extruder Multiplier set
 # in the GCode settings...
 total_material_extruded = 0  # type: float
+# running sum and accumulated rounding error of total_material_extruded (gcode.add_material)
+total_material_extruded_sum = 0.0
+total_material_extruded_error = 0.0
 material_extruded_per_color = [0, 0, 0, 0]
 last_ping_extruder_position = 0
 ping_interval = 350  # type: float
 max_ping_interval = 3000  # type: float
 ping_length_multiplier = 1.03  # type: float
+ping_window = 0  # extrusion (mm) a ping can be postponed to reach a retraction or travel move
 sidewipe_correction = 1.0  # type: float
 volumetric_e = False  # type: bool
 autoaddsplice = False  # type: bool
@@ -165,6 +180,7 @@ min_splice_length = 70  # type: int  # Minimum overall splice length.
 min_start_splice_length = 100  # type: int  # Minimum first splice length.
 
 gui = True  # Enabled/Disabled by --gui switch - enables GUI Mode which requires tkinter.
+headless = False  # No window at all, log output goes to the console (daemon and batch modes)
 consolewait = False
 
 version = "0.0.0"
@@ -174,6 +190,7 @@ versioncheck = False
 upgradeprocess = None
 
 full_purge_reduction = False
+purge_arcs = False  # half circle (G2/G3) turns in the purge tower zig-zag
 purge_first_empty = True
 purgelayer = 0
 
@@ -185,6 +202,8 @@ _obsolete_layernumber = []
 lasthopup = 0
 create_tower_entry = False
 acc_ping_left = 0.0
+acc_ping_start = None  # extrusion at the first pause of the accessory mode ping in progress
+acc_ping_dwell_time = 0.0  # seconds of pauses added by the accessory mode pings
 infill_speed = 0.0
 keep_hopspec = 0
 keep_hopcorrection = 0
@@ -0,0 +1,204 @@
+__author__ = 'Tom Van den Eede'
+__copyright__ = 'Copyright 2018-2020, Palette2 Splicer Post Processing Project'
+__credits__ = ['Tom Van den Eede',
+               'Tim Brookman'
+               ]
+__license__ = 'GPLv3'
+__maintainer__ = 'Tom Van den Eede'
+__email__ = 'P2PP@pandora.be'
+
+# Watch folder mode.  Files that are completely written into the spool directory are processed in forked jobs,
+# the results are moved into the output directory together with a <file>.json status file.
+# New files are detected through inotify on Linux, other systems poll the directory.
+
+import json
+import os
+import select
+import struct
+import sys
+import time
+
+import p2pp.daemon as daemon
+import p2pp.gui as gui
+
+WATCH_EXTENSIONS = (".gcode", ".gcode.gz", ".gcode.zst", ".bgcode")
+POLL_INTERVAL = 2.0
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+
+
+class JobLog:
+    # collects the console log of a job and echoes it with the file name
+
+    def __init__(self, name):
+        self.name = name
+        self.lines = []
+
+    def write(self, text):
+        text = text.rstrip("\n")
+        if text:
+            self.lines.append(text)
+            sys.stderr.write("[{}] {}\n".format(self.name, text))
+
+    def flush(self):
+        sys.stderr.flush()
+
+
+def is_candidate(name):
+    return not name.startswith(".") and name.lower().endswith(WATCH_EXTENSIONS)
+
+
+def inotify_open(directory):
+    # returns an inotify descriptor watching for completed files in directory, None if inotify is not available
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init()
+    except (OSError, AttributeError):
+        return None
+
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, directory.encode(sys.getfilesystemencoding()), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+def inotify_names(fd):
+    data = os.read(fd, 65536)
+    names = []
+    pos = 0
+    while pos < len(data):
+        wd, mask, cookie, length = struct.unpack_from("iIII", data, pos)
+        pos += 16
+        names.append(data[pos:pos + length].rstrip(b"\0").decode(sys.getfilesystemencoding()))
+        pos += length
+    return names
+
+
+def poll_names(directory, sizes):
+    # files whose size and modification time did not change since the previous poll
+    names = []
+    current = {}
+    for name in os.listdir(directory):
+        if not is_candidate(name):
+            continue
+        try:
+            st = os.stat(os.path.join(directory, name))
+        except OSError:
+            continue
+        current[name] = (st.st_size, st.st_mtime)
+        if sizes.get(name) == current[name]:
+            names.append(name)
+    sizes.clear()
+    sizes.update(current)
+    return names
+
+
+def status_file(output_directory, name):
+    return os.path.join(output_directory, name + ".json")
+
+
+def write_status(output_directory, name, status):
+    tmp = os.path.join(output_directory, ".{}.json.tmp".format(name))
+    with open(tmp, "w") as opf:
+        json.dump(status, opf, indent=2)
+    os.rename(tmp, status_file(output_directory, name))
+
+
+def process(directory, output_directory, name):
+    # runs in the forked job process, output files only appear in the output directory once they are complete
+    log = JobLog(name)
+    gui.log_stream = log
+
+    started = time.time()
+    result = daemon.run_job({"input_file": os.path.join(directory, name),
+                             "output_file": os.path.join(output_directory, name)})
+
+    result["started"] = started
+    result["finished"] = time.time()
+    result["log"] = log.lines
+    write_status(output_directory, name, result)
+    return result["status"] != "error"
+
+
+def start_job(directory, output_directory, name):
+    pid = os.fork()
+    if pid:
+        return pid
+
+    code = 1
+    try:
+        if process(directory, output_directory, name):
+            code = 0
+    finally:
+        os._exit(code)
+
+
+def watch(directory, output_directory=None, jobs=2):
+    directory = os.path.abspath(directory)
+    if not output_directory:
+        output_directory = os.path.join(directory, "processed")
+    output_directory = os.path.abspath(output_directory)
+    if not os.path.isdir(output_directory):
+        os.makedirs(output_directory)
+
+    # files already in the spool directory are processed unless they have an up to date status file
+    queue = []
+    for name in sorted(os.listdir(directory)):
+        if not is_candidate(name):
+            continue
+        status = status_file(output_directory, name)
+        if not os.path.exists(status) or os.path.getmtime(status) < os.path.getmtime(os.path.join(directory, name)):
+            queue.append(name)
+
+    fd = inotify_open(directory)
+    if fd is None:
+        gui.console_log("Watching {} (polling every {:.0f}s)".format(directory, POLL_INTERVAL))
+    else:
+        gui.console_log("Watching {}".format(directory))
+    gui.console_log("Processed files are written to {}".format(output_directory))
+
+    sizes = {}
+    running = {}
+    try:
+        while True:
+            while running:
+                pid, exitcode = os.waitpid(-1, os.WNOHANG)
+                if pid == 0:
+                    break
+                name = running.pop(pid)
+                if exitcode == 0:
+                    gui.console_log("Completed {}".format(name))
+                else:
+                    gui.console_log("FAILED {} - see {}".format(name, status_file(output_directory, name)))
+
+            while queue and len(running) < jobs:
+                name = queue.pop(0)
+                if os.path.exists(os.path.join(directory, name)):
+                    running[start_job(directory, output_directory, name)] = name
+
+            if fd is not None:
+                if select.select([fd], [], [], POLL_INTERVAL)[0]:
+                    names = inotify_names(fd)
+                else:
+                    names = []
+            else:
+                time.sleep(POLL_INTERVAL)
+                names = poll_names(directory, sizes)
+                # a file that stays unchanged is reported on every poll, only pick it up once per version
+                names = [name for name in names if not os.path.exists(status_file(output_directory, name)) or
+                         os.path.getmtime(status_file(output_directory, name)) <
+                         os.path.getmtime(os.path.join(directory, name))]
+
+            for name in names:
+                if is_candidate(name) and name not in queue and name not in running.values():
+                    queue.append(name)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if fd is not None:
+            os.close(fd)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+__author__ = 'Tom Van den Eede'
+__copyright__ = 'Copyright 2018-2020, Palette2 Splicer Post Processing Project'
+__credits__ = ['Tom Van den Eede',
+               'Tim Brookman'
+               ]
+__license__ = 'GPLv3'
+__maintainer__ = 'Tom Van den Eede'
+__email__ = 'P2PP@pandora.be'
+
+# Thin client for the P2PP background service (P2PP.py --daemon).
+# Accepts the same processing arguments as P2PP.py.  When no service is running, the file is
+# processed by starting P2PP.py the usual way.
+
+import argparse
+import os
+import sys
+
+import p2pp.daemon as daemon
+
+arguments = argparse.ArgumentParser(description='Submits a file to the P2PP background service.')
+
+arguments.add_argument('-i',
+                       '--input-file',
+                       required=True)
+arguments.add_argument('-d',
+                       '--output-file',
+                       required=False)
+arguments.add_argument('-o',
+                       '--splice-offset',
+                       type=float,
+                       required=False,
+                       default=40.00)
+arguments.add_argument('-p',
+                       '--printer-profile',
+                       required=False,
+                       default='')
+arguments.add_argument('--socket',
+                       required=False)
+
+if __name__ == "__main__":
+    args, other = arguments.parse_known_args()
+
+    request = {"input_file": os.path.abspath(args.input_file),
+               "printer_profile": args.printer_profile,
+               "splice_offset": args.splice_offset}
+    if args.output_file:
+        request["output_file"] = os.path.abspath(args.output_file)
+
+    result = daemon.submit(request, args.socket)
+
+    if result is None:
+        p2pp = os.path.join(os.path.dirname(os.path.abspath(sys.argv[0])), "P2PP.py")
+        os.execv(sys.executable, [sys.executable, p2pp] + sys.argv[1:])
+
+    if result["status"] == "error":
+        sys.stderr.write("P2PP processing failed: {}\n".format(result.get("error", result["input_file"])))
+        sys.exit(1)